@@ -0,0 +1,289 @@
+"""
+Benchmark the pipeline stages on a synthetic iSearch corpus and compare with a stored baseline.
+
+Benchmarks:
+ - clean_str: original clean_str and fast_clean_str on title + abstract, and check that both give the same output
+ - get_relevant_articles: text preparation and classification (model loaded beforehand)
+ - process_data: preparing relevant publications for the dashboard
+ - get_entities: NER model, one abstract at a time, sorted by length (nlp.pipe), in batches and in batches sorted by
+   length, and check that docs saved with --save-docs give the same entities when reused (needs spaCy and the NER model)
+ - clean_animal, clean_assay, clean_correlate, clean_vaccine: categorizers on the entities injected into the corpus
+ - correlate_matcher: first matching correlate rule of each correlate entity, found the way clean_correlate_entities did
+   before the rule files (re.findall of every pattern on every entity, first match kept) and by testing rules in order
+   with their literal prefilter until one matches, and check that both find the same rule
+
+Each benchmark is run --repeat times and the fastest time is kept. Times are compared with the baseline saved
+on the same machine; a benchmark more than --threshold slower than its baseline is a regression and the script exits with status 1.
+
+To use (from the repository folder):
+python -m benchmarks.run_benchmarks [--size <int>] [--repeat <int>] [--only <names>] [--save-baseline] [options]
+
+Example:
+python -m benchmarks.run_benchmarks --size 5000 --save-baseline
+python -m benchmarks.run_benchmarks --size 5000
+"""
+import os
+import re
+import sys
+import json
+import time
+import tempfile
+import argparse
+import warnings
+import numpy as np
+import benchmarks.synthetic_corpus as corpus
+import pipeline_scripts.classifier as clf
+import pipeline_scripts.prepare_isearch_data as prep
+
+warnings.filterwarnings("ignore")
+
+# default baseline file
+baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+def best_time(func, repeat):
+    """
+    Run a function several times.
+
+    Input: func (function) - function to time, called without arguments
+           repeat (int) - number of runs
+    Returns: seconds (float) - fastest run, result - result of last run
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+
+    return min(times), result
+
+def bench_clean_str(df, entity_df, args):
+    texts = (df["Title"] + ". " + df["Abstract"]).tolist()
+
+    original, _ = best_time(lambda: [clf.clean_str(x) for x in texts], args.repeat)
+    fast, _ = best_time(lambda: clf.clean_texts(texts), args.repeat)
+
+    # fast version must give the same output
+    mismatches = clf.verify_clean_str(texts)
+    if mismatches:
+        raise ValueError("fast_clean_str differs from clean_str on {} texts".format(len(mismatches)))
+
+    return {"clean_str": (original, len(texts)), "clean_str_fast": (fast, len(texts))}
+
+def bench_get_relevant_articles(df, entity_df, args):
+    model = clf.load_model(args.classifier_engine)
+
+    seconds, relevant_df = best_time(lambda: clf.get_relevant_articles(clf.prepare_text(df.copy()), model=model), args.repeat)
+    print("  {} of {} publications relevant".format(relevant_df.shape[0], df.shape[0]))
+
+    return {"get_relevant_articles": (seconds, df.shape[0])}
+
+def bench_process_data(df, entity_df, args):
+    # process_data works on relevant publications, which have Text
+    relevant_df = df.assign(Text=df["Title"] + ". " + df["Abstract"])
+
+    seconds, _ = best_time(lambda: prep.process_data(relevant_df.copy()), args.repeat)
+
+    return {"process_data": (seconds, df.shape[0])}
+
+def bench_get_entities(df, entity_df, args):
+    import pipeline_scripts.ner as ner
+
+    # NER runs on publications with entities
+    ner_df = df[df["System ID"].isin(entity_df["System_ID"])].head(args.ner_size)
+    ner_df = ner_df.assign(Text=ner_df["Title"] + ". " + ner_df["Abstract"]).rename(columns={"System ID": "System_ID"})
+
+    nlp = ner.load_model(args.ner_profile)
+
+    results = {}
+    entities = {}
+    for name, batch_size, sort_by_length in [("get_entities", None, False),
+                                             ("get_entities_sorted", None, True),
+                                             ("get_entities_batched", args.batch_size, False),
+                                             ("get_entities_batched_sorted", args.batch_size, True)]:
+        seconds, entities[name] = best_time(lambda: ner.get_entities(ner_df, batch_size=batch_size, nlp=nlp,
+                                                                     sort_by_length=sort_by_length), args.repeat)
+        results[name] = (seconds, ner_df.shape[0])
+
+    # sorting by length must not change the entities
+    if not (entities["get_entities_sorted"].equals(entities["get_entities"])
+            and entities["get_entities_batched_sorted"].equals(entities["get_entities_batched"])):
+        raise ValueError("entities differ when abstracts are sorted by length")
+
+    # saved docs must keep their entities when reloaded
+    with tempfile.TemporaryDirectory() as folder:
+        docs_path = os.path.join(folder, "docs.spacy")
+        ner.get_entities(ner_df, batch_size=args.batch_size, nlp=nlp, docs_path=docs_path)
+        doc_store = ner.load_docs(docs_path)
+    if len(doc_store) != ner_df["System_ID"].nunique():
+        raise ValueError("{} of {} docs saved".format(len(doc_store), ner_df["System_ID"].nunique()))
+    if not ner.get_entities(ner_df, nlp=nlp, doc_store=doc_store).equals(entities["get_entities"]):
+        raise ValueError("entities of saved docs differ from entities of the NER model")
+
+    return results
+
+def bench_clean_animal(df, entity_df, args):
+    import pipeline_scripts.clean_animal_entities as cln_animal
+
+    seconds, _ = best_time(lambda: cln_animal.clean_ents(entity_df), args.repeat)
+
+    return {"clean_animal": (seconds, (entity_df.Class == "animal").sum())}
+
+def bench_clean_assay(df, entity_df, args):
+    import pipeline_scripts.clean_assay_entities as cln_assay
+
+    seconds, _ = best_time(lambda: cln_assay.clean_ents(entity_df), args.repeat)
+
+    return {"clean_assay": (seconds, (entity_df.Class == "assay").sum())}
+
+def bench_clean_correlate(df, entity_df, args):
+    import pipeline_scripts.clean_correlate_entities as cln_correlate
+
+    seconds, _ = best_time(lambda: cln_correlate.clean_ents(entity_df), args.repeat)
+
+    return {"clean_correlate": (seconds, (entity_df.Class == "correlate").sum())}
+
+def bench_clean_vaccine(df, entity_df, args):
+    import pipeline_scripts.clean_vaccine_entities as cln_vaccine
+
+    vaccine_dict = cln_vaccine.make_vaccine_dict(args.vaccine_file)
+    seconds, _ = best_time(lambda: cln_vaccine.clean_ents(entity_df, vaccine_dict), args.repeat)
+
+    return {"clean_vaccine": (seconds, (entity_df.Class == "vaccine").sum())}
+
+def original_first_match(entities, rules):
+    """
+    Find the first matching rule of every entity like the per-rule loop of clean_correlate_entities before the rule files.
+
+    Input: entities (list) - entity text
+           rules (list) - rules of a pass
+    Returns: matches (array) - boolean, one row per entity and one column per rule, True for the first matching rule
+    """
+    matches = np.zeros((len(entities), len(rules)), dtype=bool)
+    for i, entity in enumerate(entities):
+        # every pattern is run on every entity, the first matching category is kept afterwards
+        matched = [j for j, rule in enumerate(rules) if re.findall(rule["pattern"], entity)]
+        if matched:
+            matches[i, matched[0]] = True
+
+    return matches
+
+def bench_correlate_matcher(df, entity_df, args):
+    import pipeline_scripts.rule_engine as rule_engine
+
+    rules = rule_engine.get_rules("correlate")["passes"][0]
+    # every row, not distinct texts, to compare the cost per entity
+    entities = entity_df[entity_df.Class == "correlate"].Entity.tolist()
+
+    original, expected = best_time(lambda: original_first_match(entities, rules["rules"]), args.repeat)
+    first_match, found = best_time(lambda: rule_engine.first_match_matrix(entities, rules["rules"]), args.repeat)
+
+    # both must find the same first rule
+    if not (expected == found).all():
+        raise ValueError("first match of correlate rules differs from the original loop on {} entities".format(
+                         int((expected != found).any(axis=1).sum())))
+
+    return {"correlate_matcher_original": (original, len(entities)), "correlate_matcher_first_match": (first_match, len(entities))}
+
+# benchmarks by name
+benchmarks = {"clean_str": bench_clean_str,
+              "get_relevant_articles": bench_get_relevant_articles,
+              "process_data": bench_process_data,
+              "get_entities": bench_get_entities,
+              "clean_animal": bench_clean_animal,
+              "clean_assay": bench_clean_assay,
+              "clean_correlate": bench_clean_correlate,
+              "clean_vaccine": bench_clean_vaccine,
+              "correlate_matcher": bench_correlate_matcher}
+
+def compare(results, baseline, threshold):
+    """
+    Print results against baseline.
+
+    Input: results (dictionary) - seconds and number of items of each benchmark
+           baseline (dictionary) - results of baseline run, None if there is none
+           threshold (float) - allowed slowdown, e.g. 0.2 for 20%
+    Returns: regressions (list) - names of benchmarks slower than baseline by more than threshold
+    """
+    regressions = []
+
+    print("{:<30} {:>10} {:>10} {:>14} {:>12} {:>10}".format("benchmark", "items", "seconds", "us/item", "baseline s", "change"))
+    for name, (seconds, items) in results.items():
+        line = "{:<30} {:>10} {:>10.3f} {:>14.1f}".format(name, items, seconds, 1e6 * seconds / max(items, 1))
+        if baseline is not None and name in baseline:
+            base_seconds = baseline[name][0]
+            ratio = seconds / max(base_seconds, 1e-9)
+            status = ""
+            if ratio > 1 + threshold:
+                status = " REGRESSION"
+                regressions.append(name)
+            elif ratio < 1 / (1 + threshold):
+                status = " faster"
+            line += " {:>12.3f} {:>9.2f}x{}".format(base_seconds, ratio, status)
+        print(line, flush=True)
+
+    return regressions
+
+def main(args):
+
+    names = args.only.split(",") if args.only else list(benchmarks)
+    unknown = [name for name in names if name not in benchmarks]
+    if unknown:
+        sys.exit("Unknown benchmarks: {}".format(", ".join(unknown)))
+
+    print("Generating {} publications...".format(args.size), flush=True)
+    df, entity_df = corpus.generate(args.size, args.seed)
+
+    results = {}
+    for name in names:
+        print("Running {}...".format(name), flush=True)
+        try:
+            results.update(benchmarks[name](df, entity_df, args))
+        except ImportError as e:
+            # e.g. spaCy or fuzzywuzzy not installed
+            print("  skipped: {}".format(e), flush=True)
+        except OSError as e:
+            # e.g. model files missing
+            print("  skipped: {}".format(e), flush=True)
+
+    # baseline is only comparable for the same corpus
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        if saved["size"] == args.size and saved["seed"] == args.seed:
+            baseline = saved["results"]
+        else:
+            print("Baseline is for {} publications with seed {}, not compared.".format(saved["size"], saved["seed"]))
+
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        # keep baselines of benchmarks not run this time
+        saved_results = dict(baseline or {})
+        saved_results.update({name: [seconds, int(items)] for name, (seconds, items) in results.items()})
+        with open(args.baseline, "w") as f:
+            json.dump({"size": args.size, "seed": args.seed, "results": saved_results}, f, indent=2)
+        print("Saved baseline to {}".format(args.baseline))
+    elif regressions:
+        sys.exit("Slower than baseline by more than {:.0%}: {}".format(args.threshold, ", ".join(regressions)))
+
+if __name__ == "__main__":
+
+    # create arguments
+    p = argparse.ArgumentParser(description=__doc__, prog="python -m benchmarks.run_benchmarks",
+                                formatter_class=argparse.RawDescriptionHelpFormatter, add_help=True)
+    p.add_argument("--size", type=int, default=2000, help="number of synthetic publications")
+    p.add_argument("--seed", type=int, default=0, help="random seed of synthetic corpus")
+    p.add_argument("--repeat", type=int, default=3, help="number of runs of each benchmark, fastest is kept")
+    p.add_argument("--only", help="comma separated benchmarks to run: " + ", ".join(benchmarks))
+    p.add_argument("--baseline", default=baseline_file, help="baseline file")
+    p.add_argument("--save-baseline", action="store_true", help="save results as baseline")
+    p.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown against baseline (0.2 is 20%%)")
+    p.add_argument("--classifier-engine", choices=["sklearn", "numpy"], default="sklearn", help="classifier implementation")
+    p.add_argument("--ner-profile", choices=["full", "entities"], default="full", help="NER model profile")
+    p.add_argument("--ner-size", type=int, default=500, help="maximum number of abstracts run through NER")
+    p.add_argument("--batch-size", type=int, default=64, help="number of abstracts per NER batch")
+    p.add_argument("--vaccine-file", default="data/COVID_19_Tracker_Vaccines_01262021.csv", help="vaccine info file")
+
+    # parse arguments
+    main(p.parse_args())
@@ -0,0 +1,163 @@
+"""
+Generate synthetic iSearch-shaped publication data for benchmarks.
+
+Relevant-looking abstracts mention animals, assays, immune correlates and vaccines; the injected mentions are
+also returned as an entity table shaped like the NER output, so the categorizers can be benchmarked without the NER model.
+
+To use:
+python -m benchmarks.synthetic_corpus --size <number of publications> --output <path/to/file> [--seed <int>]
+
+Example:
+python -m benchmarks.synthetic_corpus --size 10000 --output synthetic_isearch.csv
+"""
+import argparse
+import random
+import numpy as np
+import pandas as pd
+
+# mentions injected into abstracts for each entity class
+mentions = {
+    "animal": ["mice", "BALB/c mice", "rhesus macaques", "hamsters", "Syrian hamsters", "ferrets", "human", "humans",
+               "non-human primates", "pigs", "bats", "cats", "dogs", "cattle", "rabbits", "guinea pigs", "chickens",
+               "rodents", "African green monkeys", "camels"],
+    "assay": ["ELISA", "flow cytometry", "neutralization assay", "microneutralization", "lateral flow immunoassay",
+              "serological assays", "PRNT50", "plaque reduction neutralization test", "pseudovirus neutralization assay",
+              "ELISpot", "chemiluminescence immunoassay", "immunofluorescence", "in vitro assay", "luciferase assay",
+              "western blot", "binding assay", "enzyme-linked immunosorbent assay", "surrogate virus neutralization test"],
+    "correlate": ["neutralizing antibodies", "IgG", "IgM", "IgA", "T cells", "CD4+ T cells", "CD8+ T cells", "B cells",
+                  "memory B cells", "humoral immunity", "cellular immune response", "antibody titers",
+                  "geometric mean titers", "NK cells", "lymphocytes", "immunoglobulins", "nAbs", "Th1 responses",
+                  "binding antibodies", "protective immunity"],
+    "vaccine": ["COVID-19 vaccine", "SARS-CoV-2 vaccine", "vaccine candidate", "mRNA-1273 vaccine", "BNT162b2 vaccine",
+                "ChAdOx1 nCoV-19 vaccine", "Ad26.COV2.S vaccine", "CoronaVac vaccine", "inactivated vaccine",
+                "INO-4800 DNA vaccine", "NVX-CoV2373 vaccine", "Gam-COVID-Vac vaccine", "recombinant protein vaccine",
+                "candidate vaccine", "adenovirus vector vaccine"],
+}
+
+# sentence templates of relevant abstracts, {} is replaced with a mention of the class
+relevant_templates = [
+    ("vaccine", "We evaluated the immunogenicity of the {} in a phase I trial."),
+    ("animal", "Immunized {} were challenged with SARS-CoV-2 four weeks after the second dose."),
+    ("assay", "Serum responses were measured by {} at baseline and after vaccination."),
+    ("correlate", "Levels of {} correlated with protection against infection."),
+    ("assay", "Samples were also tested with {} to confirm the results."),
+    ("correlate", "Vaccination induced robust {} that persisted for six months."),
+    ("animal", "Protection in {} was associated with reduced viral loads in the lungs."),
+    ("vaccine", "The {} was well tolerated with mostly mild adverse events."),
+]
+
+# sentences without entities, including characters that text cleaning removes
+filler_sentences = [
+    "Coronavirus disease 2019 (COVID-19) is caused by severe acute respiratory syndrome coronavirus 2.",
+    "The pandemic has led to more than 100 million cases worldwide.",
+    "Participants were enrolled between March and June 2020; all gave informed consent.",
+    "These results support further clinical development – including larger efficacy trials.",
+    "Responses were detected in 95% of participants (n = 120) after the second dose.",
+    "The role of interleukin‐6 and TNF‐α in severe disease remains unclear.",
+    "Data are available from the corresponding author upon reasonable request.",
+    "Patients' outcomes didn't differ between groups, and we'll report follow-up data later!",
+]
+
+# abstracts about other topics, mostly classified as not relevant
+other_sentences = [
+    "We describe the soil microbiome of agricultural fields in three regions.",
+    "Hospital staffing shortages increased during the study period.",
+    "A survey of remote learning was conducted among 2,000 students.",
+    "Economic effects of lockdowns varied by sector and region.",
+    "Mental health outcomes were assessed with validated questionnaires.",
+    "We modeled traffic patterns before and after stay-at-home orders.",
+    "Telemedicine visits increased fivefold compared with 2019.",
+    "The review summarizes guidelines for elective surgery.",
+]
+
+def make_abstract(rng, relevant):
+    """
+    Make one title and abstract.
+
+    Input: rng (random.Random)
+           relevant (bool) - include entity mentions
+    Returns: title (string), abstract (string), entities (list) - (entity, class, start, end) in Title + ". " + Abstract
+    """
+    if not relevant:
+        title = rng.choice(other_sentences).rstrip(".")
+        sentences = rng.sample(other_sentences, rng.randint(4, 8)) + rng.sample(filler_sentences, rng.randint(0, 2))
+        return title, " ".join(sentences), []
+
+    ent_class, template = rng.choice(relevant_templates)
+    mention = rng.choice(mentions[ent_class])
+    title = template.format(mention).rstrip(".")
+    # offsets of title mentions, Text is Title + ". " + Abstract
+    entities = [(mention, ent_class, template.index("{}"), template.index("{}") + len(mention))]
+
+    parts = []
+    offset = len(title) + 2
+    sentences = rng.sample(filler_sentences, rng.randint(1, 3)) + \
+                [rng.choice(relevant_templates) for _ in range(rng.randint(3, 8))]
+    rng.shuffle(sentences)
+    for sentence in sentences:
+        if isinstance(sentence, tuple):
+            ent_class, template = sentence
+            mention = rng.choice(mentions[ent_class])
+            start = offset + template.index("{}")
+            entities.append((mention, ent_class, start, start + len(mention)))
+            sentence = template.format(mention)
+        # NCT numbers are extracted by process_data
+        if rng.random() < 0.05:
+            sentence = sentence.rstrip(".") + " (NCT0{}).".format(rng.randint(4000000, 4999999))
+        parts.append(sentence)
+        offset += len(sentence) + 1
+
+    return title, " ".join(parts), entities
+
+def generate(size, seed=0, relevant_share=0.5):
+    """
+    Generate publications and the entities mentioned in them.
+
+    Input: size (int) - number of publications
+           seed (int) - random seed, the same seed gives the same data
+           relevant_share (float) - share of publications with entity mentions
+    Returns: df (dataframe) - System ID, Title, Abstract, DOI and PMID columns as read from an iSearch file
+             entity_df (dataframe) - System_ID, Entity, Class, Start and End columns as returned by ner.get_entities
+    """
+    rng = random.Random(seed)
+
+    rows = []
+    entity_rows = []
+    for i in range(size):
+        sys_id = 100000 + i
+        title, abstract, entities = make_abstract(rng, rng.random() < relevant_share)
+        # preprints have no PMID and some records no DOI, read as NaN from excel
+        doi = "10.1101/2020.{:02d}.{:02d}.{}".format(rng.randint(1, 12), rng.randint(1, 28), 20000000 + i) if rng.random() < 0.9 else np.nan
+        pmid = float(32000000 + i) if rng.random() < 0.6 else np.nan
+        rows.append((sys_id, title, abstract, doi, pmid))
+        entity_rows.extend((sys_id,) + entity for entity in entities)
+
+    df = pd.DataFrame(rows, columns=["System ID", "Title", "Abstract", "DOI", "PMID"])
+    entity_df = pd.DataFrame(entity_rows, columns=["System_ID", "Entity", "Class", "Start", "End"])
+
+    return df, entity_df
+
+if __name__ == "__main__":
+
+    # create arguments
+    p = argparse.ArgumentParser(description=__doc__, prog="python -m benchmarks.synthetic_corpus", add_help=True)
+    p.add_argument("--size", type=int, default=10000, help="number of publications")
+    p.add_argument("--seed", type=int, default=0, help="random seed")
+    p.add_argument("--output", required=True, help="publication file (.xlsx, .csv, .parquet or .jsonl)")
+
+    # parse arguments
+    args = p.parse_args()
+
+    df, entity_df = generate(args.size, args.seed)
+
+    # write in a format run_pipeline.py reads
+    if args.output.endswith(".xlsx"):
+        df.to_excel(args.output, index=False)
+    elif args.output.endswith(".parquet"):
+        df.to_parquet(args.output, index=False)
+    elif args.output.endswith(".jsonl"):
+        df.to_json(args.output, orient="records", lines=True)
+    else:
+        df.to_csv(args.output, index=False)
+
+    print("Saved {} publications with {} entity mentions to {}".format(df.shape[0], entity_df.shape[0], args.output))
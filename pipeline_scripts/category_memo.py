@@ -0,0 +1,100 @@
+"""
+Persistent memo of the categories of entity texts, kept per entity class and keyed by the version of the class's
+categorization rules, so texts categorized in earlier runs are not matched again.
+"""
+
+import json
+import os
+import sqlite3
+import pipeline_scripts.run_state as run_state
+
+def rule_versions(vaccine_file):
+    """
+    Get version of the categorization rules of each entity class.
+
+    Input: vaccine_file (string) - vaccine info file the vaccine categories are matched against
+    Returns: versions (dictionary) - entity class to version
+    """
+    versions = {ent_class: run_state.file_version(["rules/{}.json".format(ent_class), "pipeline_scripts/rule_engine.py"])
+                for ent_class in ["animal", "assay", "correlate"]}
+    versions["vaccine"] = run_state.file_version(["pipeline_scripts/clean_vaccine_entities.py", vaccine_file])
+
+    return versions
+
+class CategoryMemo:
+    """
+    SQLite store of categories per entity class and entity text.
+
+    Categories of a class are cleared when the version of its rules changes.
+    """
+
+    def __init__(self, path, versions):
+        """
+        Input: path (string) - path to memo file
+               versions (dictionary) - entity class to rule version, see rule_versions
+        """
+        self.path = path
+        self.versions = versions
+        self.hits = 0
+        self.misses = 0
+
+        # create folder of memo file
+        folder = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        # streaming runs categorize in another thread than the one opening the memo
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS versions (class TEXT PRIMARY KEY, version TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS categories (class TEXT, entity TEXT, categories TEXT, PRIMARY KEY (class, entity))")
+
+        # invalidate categories of classes whose rules changed
+        stored = dict(self.conn.execute("SELECT class, version FROM versions"))
+        for ent_class, version in versions.items():
+            if stored.get(ent_class) != version:
+                if ent_class in stored:
+                    print("Categorization rules of {} entities changed, clearing their memo.".format(ent_class), flush = True)
+                self.conn.execute("DELETE FROM categories WHERE class = ?", (ent_class,))
+                self.conn.execute("INSERT OR REPLACE INTO versions VALUES (?, ?)", (ent_class, version))
+        self.conn.commit()
+
+    def get_many(self, ent_class, entities):
+        """
+        Look up categories of several entity texts.
+
+        Input: ent_class (string) - animal, assay, correlate or vaccine
+               entities (list) - distinct entity texts
+        Returns: found (dictionary) - entity text to categories for texts in memo
+        """
+        found = {}
+        # query in chunks to stay under SQLite variable limit
+        for i in range(0, len(entities), 500):
+            chunk = entities[i:i + 500]
+            query = "SELECT entity, categories FROM categories WHERE class = ? AND entity IN ({})".format(",".join("?" * len(chunk)))
+            for entity, categories in self.conn.execute(query, [ent_class] + chunk):
+                found[entity] = json.loads(categories)
+
+        self.hits += len(found)
+        self.misses += len(entities) - len(found)
+
+        return found
+
+    def put_many(self, ent_class, items):
+        """
+        Store categories of several entity texts.
+
+        Input: ent_class (string) - animal, assay, correlate or vaccine
+               items (dictionary) - entity text to categories
+        """
+        self.conn.executemany("INSERT OR REPLACE INTO categories VALUES (?, ?, ?)",
+                              [(ent_class, entity, json.dumps(categories)) for entity, categories in items.items()])
+        self.conn.commit()
+
+    def report(self):
+        """
+        Print number of distinct entity texts found and not found in memo.
+        """
+        print("Category memo hits: {}, misses: {}".format(self.hits, self.misses), flush = True)
+
+    def close(self):
+        self.conn.close()
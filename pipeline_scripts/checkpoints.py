@@ -0,0 +1,49 @@
+"""
+Checkpoints of the table each pipeline stage produces, so a run can resume from a later stage.
+"""
+
+import os
+import pickle
+
+# pipeline stages in order, and the table each stage produces
+stages = ["load", "classify", "prep", "ner", "clean"]
+stage_tables = {"load": "publications", "classify": "relevant", "prep": "processed", "ner": "entities", "clean": "categories"}
+
+def checkpoint_path(directory, stage):
+    """
+    Get path to checkpoint of a stage.
+    """
+    return os.path.join(directory, stage + ".pkl")
+
+def save_checkpoint(directory, stage, df):
+    """
+    Save table produced by a stage.
+
+    Input: directory (string) - checkpoint folder
+           stage (string) - one of stages
+           df (dataframe) - table produced by stage
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # write to temporary file first so a crash does not leave a partial checkpoint
+    path = checkpoint_path(directory, stage)
+    df.to_pickle(path + ".tmp", protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+def load_checkpoint(directory, stage):
+    """
+    Load table produced by a stage in an earlier run.
+
+    Input: directory (string) - checkpoint folder
+           stage (string) - one of stages
+    Returns: df (dataframe)
+    """
+    path = checkpoint_path(directory, stage)
+    if not os.path.exists(path):
+        raise ValueError("No checkpoint of stage {} in {}. Run the stage first.".format(stage, directory))
+
+    # pandas is imported here so the stage names can be used without importing it
+    import pandas as pd
+
+    return pd.read_pickle(path)
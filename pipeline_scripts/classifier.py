@@ -3,12 +3,12 @@ Purpose: Identify articles that are relevant to the topic of immune correlates o
 """
 
 import re
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import SGDClassifier
 import numpy as np
 import pickle
 import pandas as pd
 import os
+from multiprocessing import Pool
+import pipeline_scripts.numpy_classifier as numpy_clf
 
 def clean_str(string):
     """
@@ -32,27 +32,78 @@ def clean_str(string):
     #return string.strip().lower()
     return string.strip()
 
-def prepare_text(df):
+# characters not kept by clean_str, compiled once
+unknown_char_pattern = re.compile(r"[^A-Za-z0-9(),!?\'\`\-]")
+
+# literal substitutions of clean_str, in the same order
+literal_subs = [("'s", " 's"), ("'ve", " 've"), ("n't", " n't"), ("'re", " 're"), ("'d", " 'd"), ("'ll", " 'll"),
+                (",", " , "), ("!", " ! "), ("(", " \\( "), (")", " \\) "), ("?", " \\? ")]
+
+def fast_clean_str(string):
+    """
+    Same output as clean_str with one regex substitution, str.replace for the literal patterns and one split.
+    """
+    # replace characters that are not kept with a space
+    string = unknown_char_pattern.sub(" ", string)
+    # split off contractions and pad punctuation
+    for old, new in literal_subs:
+        if old in string:
+            string = string.replace(old, new)
+    # only spaces are left as white space, so collapse them and strip
+    return " ".join(string.split())
+
+def clean_texts(texts, n_jobs=1, chunk_size=1000):
+    """
+    Clean a column of text with fast_clean_str.
+
+    Input: texts (list or series) - text to clean
+           n_jobs (int) - number of processes to clean chunks of text in
+           chunk_size (int) - number of texts sent to a process at a time
+    Returns: cleaned (list)
+    """
+    texts = [str(x) for x in texts]
+
+    if n_jobs > 1 and len(texts) > chunk_size:
+        with Pool(n_jobs) as pool:
+            return pool.map(fast_clean_str, texts, chunksize=chunk_size)
+
+    return [fast_clean_str(x) for x in texts]
+
+def verify_clean_str(texts):
+    """
+    Check that fast_clean_str gives the same output as clean_str.
+
+    Input: texts (list or series) - text to compare on
+    Returns: mismatches (list) - texts where the outputs differ
+    """
+    return [x for x in texts if fast_clean_str(str(x)) != clean_str(str(x))]
+
+def prepare_text(df, n_jobs=1):
     """
     Clean text and concatenate title and abstract.
 
     Input: df (dataframe) - iSearch publication data
+           n_jobs (int) - number of processes to clean text in
     Returns: df (dataframe)
     """
     # concatenate title and abstract
     df["Text"] = df["Title"] + ". " + df["Abstract"]
     # clean text
-    df["cleaned_text"] = df["Text"].apply(lambda x: clean_str(str(x)))
+    df["cleaned_text"] = clean_texts(df["Text"], n_jobs=n_jobs)
 
     return df
 
-def get_relevant_articles(df):
+def load_model(engine="sklearn", mmap=False):
     """
-    Identify relevant articles using classifier.
+    Load classifier and TFIDF vectorizer.
 
-    Input: df (dataframe) - iSearch publication data
-    Returns: relevant_df (dataframe)
+    Input: engine (string) - "sklearn" for the pickled model, "numpy" for the model exported by export_classifier.py
+           mmap (bool) - memory-map the arrays of the numpy model
+    Returns: model (tuple or dictionary) - classifier and TFIDF vectorizer, or numpy model
     """
+    if engine == "numpy":
+        return numpy_clf.load_artifact(mmap=mmap)
+
     # load the model and TFIDF vectorizer
     model_filename = "sgd_l2.pkl"
     tfidf_filename = "tfidf.pkl"
@@ -60,12 +111,74 @@ def get_relevant_articles(df):
     sgd_classifier = pickle.load(open(os.path.join(model_folder, model_filename), "rb"))
     tfidfvectorizer = pickle.load(open(os.path.join(model_folder, tfidf_filename), "rb"))
 
+    return sgd_classifier, tfidfvectorizer
+
+def score(model, texts):
+    """
+    Get predicted labels and probabilities, computing the decision function once.
+
+    Input: model (tuple or dictionary) - from load_model
+           texts (list) - cleaned text
+    Returns: predictions (array), probabilities (array) - one column per class
+    """
+    # nothing to score, e.g. no new publications in an incremental run
+    if len(texts) == 0:
+        classes = model["classes"] if isinstance(model, dict) else model[0].classes_
+        return np.asarray(classes)[:0], np.zeros((0, len(classes)))
+
+    # score with numpy model
+    if isinstance(model, dict):
+        return numpy_clf.score(model, texts)
+
+    sgd_classifier, tfidfvectorizer = model
+
     # encode text
-    encoded_text = tfidfvectorizer.transform(df["cleaned_text"].values)
-    # get predicted labels
-    predictions = sgd_classifier.predict(encoded_text)
-    # get probabilities
-    probabilities = sgd_classifier.predict_proba(encoded_text)
+    encoded_text = tfidfvectorizer.transform(texts)
+    # labels and probabilities are both derived from the decision function
+    scores = sgd_classifier.decision_function(encoded_text)
+
+    return numpy_clf.labels_and_probabilities(sgd_classifier.loss, sgd_classifier.classes_, scores)
+
+# model of each classifier worker process
+worker_model = None
+
+def init_worker(model):
+    global worker_model
+    worker_model = model
+
+def score_chunk(texts):
+    return score(worker_model, texts)
+
+def get_relevant_articles(df, model=None, chunk_size=None, n_jobs=1):
+    """
+    Identify relevant articles using classifier.
+
+    Input: df (dataframe) - iSearch publication data
+           model (tuple or dictionary) - already loaded model from load_model, sklearn model loaded if None
+           chunk_size (int) - number of publications encoded at a time, None for all at once
+           n_jobs (int) - number of processes to score chunks in
+    Returns: relevant_df (dataframe)
+    """
+    # load the model and TFIDF vectorizer
+    if model is None:
+        model = load_model()
+
+    texts = df["cleaned_text"].values
+
+    if chunk_size is None:
+        # get predicted labels and probabilities
+        predictions, probabilities = score(model, texts)
+    else:
+        # split text into chunks so only one chunk is encoded at a time per process
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        if n_jobs > 1:
+            with Pool(n_jobs, initializer=init_worker, initargs=(model,)) as pool:
+                results = pool.map(score_chunk, chunks)
+        else:
+            results = [score(model, chunk) for chunk in chunks]
+        # combine chunks in order
+        predictions = np.concatenate([result[0] for result in results]) if results else np.array([], dtype=int)
+        probabilities = np.concatenate([result[1] for result in results]) if results else np.zeros((0, 2))
     # keep only the max probability for each publication
     max_probs = np.amax(probabilities, axis=1)
 
@@ -79,3 +192,43 @@ def get_relevant_articles(df):
     relevant_df = df[df.prediction == 1]
 
     return relevant_df
+
+def gate_relevant(relevant_df, min_probability=None, top_k=None, budget=None, docs_per_sec=None):
+    """
+    Limit relevant articles sent to NER by probability threshold, top-K by probability and time budget.
+
+    Input: relevant_df (dataframe) - relevant articles from get_relevant_articles
+           min_probability (float) - keep articles with at least this probability
+           top_k (int) - keep this many articles with the highest probability
+           budget (float) - seconds available for NER
+           docs_per_sec (float) - NER throughput used to turn budget into a number of articles
+    Returns: gated_df (dataframe) - kept articles in their original order
+    """
+    print("Relevant publications before gating: {}".format(relevant_df.shape[0]), flush = True)
+
+    gated_df = relevant_df
+
+    # keep articles above threshold
+    if min_probability is not None:
+        gated_df = gated_df[gated_df.probability >= min_probability]
+        print("Publications with probability >= {}: {}".format(min_probability, gated_df.shape[0]), flush = True)
+
+    # number of articles allowed by top-K and time budget
+    caps = []
+    if top_k is not None:
+        caps.append(top_k)
+        print("Publications within top {} by probability: {}".format(top_k, min(top_k, gated_df.shape[0])), flush = True)
+    if budget is not None:
+        budget_k = int(budget * docs_per_sec)
+        caps.append(budget_k)
+        print("Publications within NER budget of {}s at {} docs/sec: {}".format(budget, docs_per_sec,
+              min(budget_k, gated_df.shape[0])), flush = True)
+
+    # keep articles with highest probability, ties kept in original order; by position as index labels may repeat
+    if len(caps) > 0:
+        keep = np.argsort(-gated_df.probability.values, kind="mergesort")[:min(caps)]
+        gated_df = gated_df.iloc[np.sort(keep)]
+
+    print("Publications sent to NER: {}".format(gated_df.shape[0]), flush = True)
+
+    return gated_df
@@ -7,12 +7,86 @@ import re
 import numpy as np
 from fuzzywuzzy import fuzz, process
 
-def clean_ents(df, vaccine_dict):
+def best_vaccine_type(text, vaccine_dict):
+    """
+    Find vaccine type whose products best match text with FuzzyWuzzy.
+
+    Input: text (string) - entity or part of entity
+           vaccine_dict (dictionary) - vaccine info from Milken Institute
+    Returns: max_category (string) - vaccine type, max_score (int) - score of best matching product
+    """
+    # dictionary to hold scores for vaccine categories
+    scores = dict()
+    # iterate through dictionary vaccine types
+    for vaccine, vaccine_products in vaccine_dict.items():
+        # get best score for each vaccine type
+        best_ratio = process.extractOne(text, vaccine_products, scorer=fuzz.token_set_ratio)
+        # store score
+        scores[vaccine] = best_ratio[1]
+    # get category with max score
+    max_category = max(scores, key=scores.get)
+    # get max score
+    max_score = max(scores.values())
+
+    return max_category, max_score
+
+def categorize_vaccine_term(entity, vaccine_dict):
+    """
+    Categorize entity containing vaccine or candidate and terms besides COVID-19.
+
+    Input: entity (string)
+           vaccine_dict (dictionary) - vaccine info from Milken Institute
+    Returns: category (string)
+    """
+    # list of COVID-19 related terms
+    covid_list = ["ncov19","nco-19","covid19","covid-19","sars-cov-2","cov2","cov","sars-cov"]
+
+    # get list of matching patterns - first group is anything preceding vaccine or candidate
+    entity_sub = re.findall('(.*)(\s|-)(vaccin.*|candidat*).*', entity.lower())
+    # if length of list is 0
+    if len(entity_sub) == 0:
+        # if entity contains COVID-19-related terms
+        if any(ele in entity.lower() for ele in covid_list):
+            # classify as general COVID-19 vaccine
+            return "general COVID-19 vaccine"
+        # classify as non-specific vaccine
+        return "non-specific vaccine"
+    # if entity group is empty string, indicates it didn't match patterns
+    elif entity_sub[0][0] is " ":
+        # classify as non-specific vaccine
+        return "non-specific vaccine"
+
+    max_category, max_score = best_vaccine_type(entity_sub[0][0], vaccine_dict)
+    # if max score above threshold
+    if max_score >= 65:
+        # save category as vaccine type
+        return max_category
+    # classify as non-specific vaccine
+    return "non-specific vaccine"
+
+def categorize_no_vaccine_term(entity, vaccine_dict):
+    """
+    Categorize entity without vaccine term.
+
+    Input: entity (string)
+           vaccine_dict (dictionary) - vaccine info from Milken Institute
+    Returns: category (string)
+    """
+    max_category, max_score = best_vaccine_type(entity, vaccine_dict)
+    # if max score above threshold
+    if max_score >= 65:
+        # save category as vaccine type
+        return max_category
+    # else label as false positive
+    return "false positive"
+
+def clean_ents(df, vaccine_dict, memo=None):
     """
     Filtering entity output doc to only include vaccine entities and categorize entities.
 
     Input: df (dataframe) - uncategorized entities
            vaccine_dict (dictionary) - vaccine info from Milken Institute
+           memo (dictionary) - categories of entities matched with FuzzyWuzzy before, new entities are added to it
     Returns: vaccine_final (dataframe) - categorized entities
     """
 
@@ -51,76 +125,25 @@ def clean_ents(df, vaccine_dict):
     vaccine_ent_other = vaccine_ent_other[~vaccine_ent_other.Entity.str.
                               contains("^(vaccin.*)\s(candidat.*)", case=False)]
 
-    """Use FuzzyWuzzy for entities containing vaccine and terms besides COVID-19"""
+    """Use FuzzyWuzzy for entities, once for each distinct entity"""
 
-    # list of COVID-19 related terms
-    covid_list = ["ncov19","nco-19","covid19","covid-19","sars-cov-2","cov2","cov","sars-cov"]
+    # categories of entities categorized before
+    if memo is None:
+        memo = {}
+
+    # categorize entities containing vaccine and terms besides COVID-19
+    for entity in vaccine_ent_other.Entity.unique():
+        if entity not in memo:
+            memo[entity] = categorize_vaccine_term(entity, vaccine_dict)
+
+    # categorize entities without vaccine term
+    for entity in vaccine_ent_no_vaccine.Entity.unique():
+        if entity not in memo:
+            memo[entity] = categorize_no_vaccine_term(entity, vaccine_dict)
 
-    # go through each row in dataframe
-    for index, row in vaccine_ent_other.iterrows():
-        # get entity
-        entity = vaccine_ent_other.loc[index, "Entity"]
-        # get list of matching patterns - first group is anything preceding vaccine or candidate
-        entity_sub = re.findall('(.*)(\s|-)(vaccin.*|candidat*).*', entity.lower())
-        # if length of list is 0
-        if len(entity_sub) == 0:
-            # if entity contains COVID-19-related terms
-            if any(ele in entity.lower() for ele in covid_list):
-                # classify as general COVID-19 vaccine
-                vaccine_ent_other.loc[index, "Category"] = "general COVID-19 vaccine"
-            else:
-                # classify as non-specific vaccine
-                vaccine_ent_other.loc[index, "Category"] = "non-specific vaccine"
-        # if entity group is empty string, indicates it didn't match patterns
-        elif entity_sub[0][0] is " ":
-            # classify as non-specific vaccine
-            vaccine_ent_other.loc[index, "Category"] = "non-specific vaccine"
-        else:
-            # dictionary to hold scores for vaccine categories
-            scores = dict()
-            # iterate through dictionary vaccine types
-            for vaccine, vaccine_products in vaccine_dict.items():
-                # get best score for each vaccine type
-                best_ratio = process.extractOne(entity_sub[0][0], vaccine_products, scorer=fuzz.token_set_ratio)
-                # store score
-                scores[vaccine] = best_ratio[1]
-            # get category with max score
-            max_category = max(scores, key=scores.get)
-            # get max score
-            max_score = max(scores.values())
-            # if max score above threshold
-            if max_score >= 65:
-                # save category as vaccine type
-                vaccine_ent_other.loc[index, "Category"] = max_category
-            else:
-                # classify as non-specific vaccine
-                vaccine_ent_other.loc[index, "Category"] = "non-specific vaccine"
-
-    """Use FuzzyWuzzy for entities without vaccine term"""
-
-    # go through each row in dataframe
-    for index, row in vaccine_ent_no_vaccine.iterrows():
-        # get entity
-        entity = vaccine_ent_no_vaccine.loc[index, "Entity"]
-        # dictionary to hold scores for vaccine categories
-        scores = dict()
-        # iterate through dictionary vaccine types
-        for vaccine, vaccine_products in vaccine_dict.items():
-            # get best score for each vaccine type
-            best_ratio = process.extractOne(entity, vaccine_products, scorer=fuzz.token_set_ratio)
-            # store score
-            scores[vaccine] = best_ratio[1]
-        # get category with max score
-        max_category = max(scores, key=scores.get)
-        # get max score
-        max_score = max(scores.values())
-        # if max score above threshold
-        if max_score >= 65:
-            # save category as vaccine type
-            vaccine_ent_no_vaccine.loc[index, "Category"] = max_category
-        else:
-            # else label as false positive
-            vaccine_ent_no_vaccine.loc[index, "Category"] = "false positive"
+    # add categories to rows
+    vaccine_ent_other["Category"] = vaccine_ent_other.Entity.map(memo)
+    vaccine_ent_no_vaccine["Category"] = vaccine_ent_no_vaccine.Entity.map(memo)
 
     # combine all dataframes
     vaccine_final = pd.concat([vaccine_ent_covid_only,
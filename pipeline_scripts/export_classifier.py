@@ -0,0 +1,78 @@
+"""
+Export the pickled TFIDF vectorizer and SGD classifier to NumPy arrays that numpy_classifier.py can score with.
+
+To use:
+python pipeline_scripts/export_classifier.py [--model-folder <path/to/folder>] [--output <path/to/folder>]
+
+Files that are generated (in models/classifier/numpy by default):
+
+params.json: vectorizer settings, stop words and loss of classifier
+
+vocabulary.npy, idf.npy: terms (by column index) and inverse document frequencies of TFIDF vectorizer
+
+coef.npy, intercept.npy, classes.npy: coefficients, intercept and class labels of classifier
+"""
+import os
+import json
+import pickle
+import argparse
+import numpy as np
+
+def export(model_folder, output):
+    """
+    Export classifier and TFIDF vectorizer.
+
+    Input: model_folder (string) - folder with sgd_l2.pkl and tfidf.pkl
+           output (string) - folder to write arrays to
+    """
+    sgd_classifier = pickle.load(open(os.path.join(model_folder, "sgd_l2.pkl"), "rb"))
+    tfidfvectorizer = pickle.load(open(os.path.join(model_folder, "tfidf.pkl"), "rb"))
+
+    # only the settings numpy_classifier.transform implements
+    if tfidfvectorizer.analyzer != "word" or tfidfvectorizer.ngram_range != (1, 1) \
+            or tfidfvectorizer.preprocessor is not None or tfidfvectorizer.tokenizer is not None \
+            or tfidfvectorizer.strip_accents is not None:
+        raise ValueError("Only word unigram TFIDF vectorizers without custom preprocessing can be exported.")
+    if len(sgd_classifier.classes_) != 2:
+        raise ValueError("Only binary classifiers can be exported.")
+
+    if not os.path.exists(output):
+        os.makedirs(output)
+
+    # terms ordered by column index
+    vocabulary = sorted(tfidfvectorizer.vocabulary_, key=tfidfvectorizer.vocabulary_.get)
+    stop_words = tfidfvectorizer.get_stop_words()
+
+    # TFIDF weighting settings are held by the vectorizer's transformer
+    tfidf_transformer = tfidfvectorizer._tfidf
+
+    params = {"lowercase": tfidfvectorizer.lowercase,
+              "token_pattern": tfidfvectorizer.token_pattern,
+              "stop_words": sorted(stop_words) if stop_words else [],
+              "norm": tfidf_transformer.norm,
+              "use_idf": tfidf_transformer.use_idf,
+              "sublinear_tf": tfidf_transformer.sublinear_tf,
+              "loss": sgd_classifier.loss}
+
+    with open(os.path.join(output, "params.json"), "w") as f:
+        json.dump(params, f, indent=2)
+
+    np.save(os.path.join(output, "vocabulary.npy"), np.array(vocabulary))
+    np.save(os.path.join(output, "idf.npy"), np.asarray(tfidf_transformer.idf_, dtype=np.float64))
+    np.save(os.path.join(output, "coef.npy"), np.asarray(sgd_classifier.coef_, dtype=np.float64))
+    np.save(os.path.join(output, "intercept.npy"), np.asarray(sgd_classifier.intercept_, dtype=np.float64))
+    np.save(os.path.join(output, "classes.npy"), np.asarray(sgd_classifier.classes_))
+
+    print("Exported classifier with {} terms to {}".format(len(vocabulary), os.path.abspath(output)), flush = True)
+
+if __name__ == "__main__":
+
+    # create arguments
+    p = argparse.ArgumentParser(description=__doc__, prog = "export_classifier.py", add_help=True)
+    p.add_argument("--model-folder", default="models/classifier", help="folder of pickled classifier")
+    p.add_argument("--output", default="models/classifier/numpy", help="folder to write arrays to")
+
+    # parse arguments
+    args = p.parse_args()
+
+    export(args.model_folder, args.output)
@@ -0,0 +1,52 @@
+"""
+Modules imported on first use, so stages that are not run do not pay for importing pandas, spaCy, sklearn or fuzzywuzzy.
+"""
+
+import importlib
+import time
+
+# seconds taken by the first import of each lazily imported module, in import order
+import_times = {}
+
+class LazyModule:
+    """
+    Stand-in for a module that imports it when one of its attributes is first used.
+    """
+
+    def __init__(self, name):
+        """
+        Input: name (string) - module name, e.g. pipeline_scripts.ner
+        """
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            start = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            import_times[self._name] = time.perf_counter() - start
+
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+def module(name):
+    """
+    Get module that is imported on first use.
+
+    Input: name (string) - module name
+    Returns: module (LazyModule)
+    """
+    return LazyModule(name)
+
+def report():
+    """
+    Print time taken to import each module that was used.
+    """
+    if not import_times:
+        return
+
+    print("Import times (including modules they import):")
+    for name, seconds in import_times.items():
+        print("  {:<45} {:>7.2f}s".format(name, seconds), flush = True)
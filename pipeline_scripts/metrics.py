@@ -0,0 +1,135 @@
+"""
+Wall time, CPU time, peak memory and throughput of each pipeline stage, with optional cProfile output per stage.
+"""
+
+import cProfile
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# resource is not available on Windows, peak memory is then not reported
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_rss_mb():
+    """
+    Get peak resident memory of this process and of finished child processes.
+
+    Returns: peak (float) - megabytes, None if not available
+    """
+    if resource is None:
+        return None
+
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / 1024 ** 2
+
+    return peak / 1024
+
+def cpu_seconds():
+    """
+    Get CPU time used by this process and by finished child processes, e.g. classifier or NER processes.
+    """
+    times = os.times()
+
+    return times.user + times.system + times.children_user + times.children_system
+
+class StageMetrics:
+    """
+    Record of the stages of one run.
+    """
+
+    def __init__(self, profile_dir=None):
+        """
+        Input: profile_dir (string) - folder to write cProfile data of each stage to, None to not profile
+        """
+        self.profile_dir = profile_dir
+        self.stages = []
+        # profilers of the stages running, only the innermost one is enabled
+        self.profilers = []
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """
+        Measure a stage.
+
+        Input: name (string) - stage name
+               rows_in (int) - number of rows going into stage
+        Yields: record (dictionary) - set record["rows_out"] to the number of rows the stage produced
+        """
+        record = {"stage": name, "rows_in": rows_in, "rows_out": None}
+
+        profiler = None
+        if self.profile_dir is not None:
+            profiler = cProfile.Profile()
+            # pause profiler of enclosing stage, a nested stage is profiled in its own file
+            if self.profilers:
+                self.profilers[-1].disable()
+            self.profilers.append(profiler)
+
+        wall_start = time.perf_counter()
+        cpu_start = cpu_seconds()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self.profilers.pop()
+                if self.profilers:
+                    self.profilers[-1].enable()
+            record["wall_seconds"] = time.perf_counter() - wall_start
+            record["cpu_seconds"] = cpu_seconds() - cpu_start
+            record["peak_rss_mb"] = peak_rss_mb()
+            record["docs_per_sec"] = None
+            if rows_in is not None and record["wall_seconds"] > 0:
+                record["docs_per_sec"] = rows_in / record["wall_seconds"]
+            self.stages.append(record)
+
+            if profiler is not None:
+                if not os.path.exists(self.profile_dir):
+                    os.makedirs(self.profile_dir)
+                # view with: python -m pstats <file>
+                profiler.dump_stats(os.path.join(self.profile_dir, name + ".prof"))
+
+    def add(self, name, wall_seconds, cpu_seconds, rows_in=None, rows_out=None):
+        """
+        Record a stage measured elsewhere, e.g. in another process.
+
+        Input: name (string) - stage name
+               wall_seconds (float), cpu_seconds (float) - time taken
+               rows_in (int), rows_out (int) - number of rows going into and produced by stage
+        """
+        self.stages.append({"stage": name, "rows_in": rows_in, "rows_out": rows_out, "wall_seconds": wall_seconds,
+                            "cpu_seconds": cpu_seconds, "peak_rss_mb": peak_rss_mb(),
+                            "docs_per_sec": rows_in / wall_seconds if rows_in is not None and wall_seconds > 0 else None})
+
+    def report(self):
+        """
+        Print time, memory and throughput of each stage.
+        """
+        print("{:<40} {:>10} {:>10} {:>12} {:>10} {:>10} {:>12}".format(
+              "stage", "wall (s)", "cpu (s)", "peak RSS MB", "rows in", "rows out", "docs/sec"))
+        for record in self.stages:
+            print("{:<40} {:>10.2f} {:>10.2f} {:>12} {:>10} {:>10} {:>12}".format(
+                  record["stage"], record["wall_seconds"], record["cpu_seconds"],
+                  "-" if record["peak_rss_mb"] is None else "{:.0f}".format(record["peak_rss_mb"]),
+                  "-" if record["rows_in"] is None else record["rows_in"],
+                  "-" if record["rows_out"] is None else record["rows_out"],
+                  "-" if record["docs_per_sec"] is None else "{:.1f}".format(record["docs_per_sec"])), flush = True)
+
+    def save(self, path, import_times=None):
+        """
+        Write metrics of each stage to a JSON file.
+
+        Input: path (string) - path to JSON file
+               import_times (dictionary) - seconds taken to import each module
+        """
+        with open(path, "w") as f:
+            json.dump({"stages": self.stages, "imports": import_times or {}}, f, indent=2)
@@ -5,26 +5,125 @@ Loading the custom NER model and running output from the classifier through it.
 import numpy as np
 import pandas as pd
 import spacy
+from spacy.tokens import DocBin
+from spacy.vocab import Vocab
 import os
+import time
 
-def get_entities(df):
-    """
-    Run NER model and get entities.
+# path to NER model
+ner_model_dir = "models/ner/Base_NER"
 
-    Input: df (dataframe) - contains relevant abstracts
-    Returns: entity_df (dataframe) - entities found in abstracts
+# pipeline components to disable for each profile - get_entities only reads doc.ents
+profiles = {"full": [], "entities": ["tagger", "parser"]}
+
+# token attributes saved with docs besides the text - entities, and the parse the sentences of --sentences come from
+# (SENT_START can not be restored together with HEAD)
+doc_attrs = ["ENT_IOB", "ENT_TYPE", "HEAD", "DEP"]
+
+def load_model(profile="full"):
     """
-    # path to NER model
-    ner_model_dir = "models/ner/Base_NER"
+    Load NER model with the components of the profile disabled.
 
+    Input: profile (string) - "full" for all components, "entities" for ner and entity_ruler only
+    Returns: nlp (spacy Language)
+    """
     print("Loading NER model from", ner_model_dir)
 
     # load model
-    nlp = spacy.load(ner_model_dir)
+    nlp = spacy.load(ner_model_dir, disable=profiles[profile])
 
     # shows all pipe names for loaded model
     print("Model pipe names:", nlp.pipe_names)
 
+    return nlp
+
+def doc_entities(doc, sentences=False):
+    """
+    Get entities of a doc, keeping one entity per distinct entity text.
+
+    Input: doc (spacy Doc)
+           sentences (bool) - add character offsets of the sentence of each entity
+    Returns: ents (list) - tuples of entity text, label, start and end offsets (and sentence start and end offsets)
+    """
+    # create dictionary to hold entities
+    ent_bc = {}
+    # get entities and their labels
+    for x in doc.ents:
+        ent_bc[x.text] = x
+
+    ents = []
+    for key in ent_bc:
+        ent = ent_bc[key]
+        if sentences:
+            ents.append((key, ent.label_, ent.start_char, ent.end_char, ent.sent.start_char, ent.sent.end_char))
+        else:
+            ents.append((key, ent.label_, ent.start_char, ent.end_char))
+
+    return ents
+
+def load_docs(path):
+    """
+    Load docs saved by get_entities.
+
+    Input: path (string) - path to doc store
+    Returns: docs (dictionary) - System_ID (string) to doc
+    """
+    with open(path, "rb") as f:
+        doc_bin = DocBin(attrs=doc_attrs, store_user_data=True).from_bytes(f.read())
+
+    # doc store only keeps token texts, entity and dependency labels come from the strings of the model
+    vocab = Vocab()
+    vocab.strings.from_disk(os.path.join(ner_model_dir, "vocab", "strings.json"))
+
+    return {doc.user_data["System_ID"]: doc for doc in doc_bin.get_docs(vocab)}
+
+def save_docs(path, doc_bin, sys_ids):
+    """
+    Save docs to doc store, keeping docs already in the store for other System_IDs.
+
+    Input: path (string) - path to doc store
+           doc_bin (DocBin) - docs of this run
+           sys_ids (set) - System_IDs (string) of docs in doc_bin
+    """
+    if os.path.exists(path):
+        for sys_id, doc in load_docs(path).items():
+            if sys_id not in sys_ids:
+                doc_bin.add(doc)
+
+    with open(path, "wb") as f:
+        f.write(doc_bin.to_bytes())
+
+    print("Saved {} docs to {}".format(len(doc_bin), path), flush = True)
+
+def get_entities(df, batch_size=None, n_process=1, profile="full", nlp=None, sentences=False, cache=None,
+                 doc_store=None, docs_path=None, sort_by_length=False):
+    """
+    Run NER model and get entities.
+
+    Entities are kept as character offsets into Text, docs are discarded after extraction.
+
+    Input: df (dataframe) - contains relevant abstracts
+           batch_size (int) - number of abstracts per nlp.pipe batch, None to run one abstract at a time
+           n_process (int) - number of processes used by nlp.pipe
+           profile (string) - model profile to load, see profiles
+           nlp (spacy Language) - already loaded model, loaded from profile if None
+           sentences (bool) - add character offsets of the sentence of each entity (needs parser)
+           cache (EntityCache) - cache of entities, abstracts found in cache are not run through model
+           doc_store (dictionary) - docs from load_docs, abstracts with a doc of the same text are not run through model
+           docs_path (string) - path to save docs run through model (or reused from doc_store) to
+           sort_by_length (bool) - run abstracts through model from shortest to longest so batches hold abstracts of similar length,
+                                   entities are returned in the original order, runs nlp.pipe even without batch_size
+    Returns: entity_df (dataframe) - entities found in abstracts
+    """
+    # columns of entity table
+    columns = ["System_ID", "Entity", "Class", "Start", "End"]
+    if sentences:
+        columns += ["Sent_Start", "Sent_End"]
+
+    # no abstracts, e.g. none relevant
+    if df.shape[0] == 0:
+        return pd.DataFrame([], columns=columns)
+
     # select columns needed - System_ID is unique identifier from iSearch
     df = df[["System_ID", "Text"]]
 
@@ -34,37 +133,117 @@ def get_entities(df):
     # remove line breaks
     df["Text"] = df["Text"].apply(lambda x: x.replace("\n"," "))
 
+    # skip abstracts where text is a float type
+    df = df[df["Text"].map(lambda x: not isinstance(x, float)).astype(bool)]
+
+    texts = df["Text"].tolist()
+    sys_ids = [str(sys_id) for sys_id in df["System_ID"]]
+    # entities of each abstract
+    doc_ents = [None] * len(texts)
+
+    # docs to save
+    if docs_path:
+        doc_bin = DocBin(attrs=doc_attrs, store_user_data=True)
+        saved_ids = set()
+
+    # get entities from saved docs if text is unchanged
+    if doc_store is not None:
+        for i, (sys_id, text) in enumerate(zip(sys_ids, texts)):
+            doc = doc_store.get(sys_id)
+            # docs saved without the parser have no sentences
+            if sentences and doc is not None and not doc.user_data.get("Parsed"):
+                doc = None
+            if doc is not None and doc.text == text:
+                doc_ents[i] = doc_entities(doc, sentences)
+                if docs_path and sys_id not in saved_ids:
+                    doc_bin.add(doc)
+                    saved_ids.add(sys_id)
+        print("Reused {} saved docs.".format(sum(1 for ents in doc_ents if ents is not None)), flush = True)
+
+    # get entities from cache
+    if cache is not None:
+        variant = "{}:{}".format(profile, sentences)
+        keys = [cache.make_key(text, variant) for text in texts]
+        found = cache.get_many([keys[i] for i, ents in enumerate(doc_ents) if ents is None])
+        for i, key in enumerate(keys):
+            if doc_ents[i] is None:
+                doc_ents[i] = found.get(key)
+
+    # abstracts that still need to be run through the model
+    todo = [i for i, ents in enumerate(doc_ents) if ents is None]
+
+    if len(todo) > 0:
+        # load model
+        if nlp is None:
+            nlp = load_model(profile)
+
+        # order abstracts by length, entities are stored by position so original order is kept
+        if sort_by_length:
+            todo.sort(key=lambda i: len(texts[i]))
+
+        todo_texts = [texts[i] for i in todo]
+
+        ner_start = time.perf_counter()
+
+        # run model on text - one abstract at a time or in batches, sorting only pays off in batches
+        if batch_size is None and n_process == 1 and not sort_by_length:
+            docs = (nlp(text) for text in todo_texts)
+        else:
+            docs = nlp.pipe(todo_texts, batch_size=batch_size or 1000, n_process=n_process)
+
+        for i, doc in zip(todo, docs):
+            doc_ents[i] = doc_entities(doc, sentences)
+            # keep serialized doc only
+            if docs_path and sys_ids[i] not in saved_ids:
+                doc.user_data["System_ID"] = sys_ids[i]
+                doc.user_data["Parsed"] = doc.is_parsed
+                doc_bin.add(doc)
+                saved_ids.add(sys_ids[i])
+
+        ner_time = time.perf_counter() - ner_start
+        print("NER model ran on {} abstracts at {:.1f} docs/sec.".format(len(todo), len(todo) / max(ner_time, 1e-9)), flush = True)
+
+        # save new entities to cache
+        if cache is not None:
+            cache.put_many({keys[i]: doc_ents[i] for i in todo})
+
+    # save docs
+    if docs_path:
+        save_docs(docs_path, doc_bin, saved_ids)
+
     # create table
-    table = {"System_ID":[], "Doc":[],"Entity":[], "Class":[]}
-
-    # create index
-    df.index
-
-    # loop through each abstract
-    for index, row in df.iterrows():
-        # get System_ID
-        sys_id = df.loc[index, "System_ID"]
-        # get Text
-        text = df.loc[index, "Text"]
-        # skip if text is a float type
-        if type(text) == float:
-            continue
-        # run model on text
-        doc = nlp(text)
-        # create dictionary to hold entities
-        ent_bc = {}
-        # get entities and their labels
-        for x in doc.ents:
-            ent_bc[x.text] = x.label_
-
-        # append values to table
-        for key in ent_bc:
-            table["System_ID"].append(sys_id)
-            table["Doc"].append(doc)
-            table["Entity"].append(key)
-            table["Class"].append(ent_bc[key])
+    rows = [(sys_id,) + tuple(ent) for sys_id, ents in zip(df["System_ID"], doc_ents) for ent in ents]
 
     # convert table to dateframe
-    entity_df = pd.DataFrame(table)
+    entity_df = pd.DataFrame(rows, columns=columns)
 
     return entity_df
+
+def check_profile(df, profile="entities", batch_size=None, n_process=1):
+    """
+    Check that a profile extracts the same entities as the full model and report the speedup.
+
+    Input: df (dataframe) - contains relevant abstracts
+           profile (string) - model profile to compare against "full"
+           batch_size (int) - number of abstracts per nlp.pipe batch
+           n_process (int) - number of processes used by nlp.pipe
+    Returns: same (bool) - True if both profiles give the same entities
+    """
+    times = {}
+    ents = {}
+
+    for name in ["full", profile]:
+        nlp = load_model(name)
+        # time only the processing, not the loading
+        profile_start = time.perf_counter()
+        entity_df = get_entities(df, batch_size=batch_size, n_process=n_process, nlp=nlp)
+        times[name] = time.perf_counter() - profile_start
+        ents[name] = entity_df.reset_index(drop=True)
+
+    same = ents["full"].equals(ents[profile])
+
+    print("Entities unchanged with {} profile: {}".format(profile, same), flush = True)
+    print("NER time full: {:.1f}s, {}: {:.1f}s, speedup: {:.2f}x".format(times["full"], profile,
+          times[profile], times["full"] / max(times[profile], 1e-9)), flush = True)
+
+    return same
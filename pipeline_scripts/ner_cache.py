@@ -0,0 +1,130 @@
+"""
+Persistent cache of NER results keyed by a hash of the abstract text and the NER model version.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+def model_version(model_dir):
+    """
+    Make a version string for the NER model from the names, sizes and modification times of its files.
+
+    Input: model_dir (string) - path to NER model
+    Returns: version (string)
+    """
+    sha = hashlib.sha1()
+    # walk model folder in a fixed order
+    for root, dirs, files in sorted(os.walk(model_dir)):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            sha.update("{}:{}:{}\n".format(os.path.relpath(path, model_dir), stat.st_size, stat.st_mtime_ns).encode("utf-8"))
+
+    return sha.hexdigest()
+
+class EntityCache:
+    """
+    SQLite store of entities per abstract text.
+
+    The cache is cleared when the model version changes and the least recently used entries
+    are evicted once it holds more than max_entries abstracts.
+    """
+
+    def __init__(self, path, version, max_entries=100000):
+        """
+        Input: path (string) - path to cache file
+               version (string) - NER model version, see model_version
+               max_entries (int) - maximum number of abstracts kept in cache
+        """
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        # create folder of cache file
+        folder = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        # streaming runs use the cache in the NER stage thread, not the one opening it
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS entities (key TEXT PRIMARY KEY, ents TEXT, last_used REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entities_last_used ON entities (last_used)")
+
+        # invalidate cache if model changed
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'model_version'").fetchone()
+        if row is None or row[0] != version:
+            if row is not None:
+                print("NER model changed, clearing NER cache.", flush = True)
+            self.conn.execute("DELETE FROM entities")
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('model_version', ?)", (version,))
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(text, variant=""):
+        """
+        Hash abstract text, variant separates results of different NER settings.
+
+        Input: text (string) - cleaned abstract text
+               variant (string) - NER settings the entities depend on
+        Returns: key (string)
+        """
+        return hashlib.sha1((variant + "\0" + text).encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """
+        Look up entities of several abstracts.
+
+        Input: keys (list) - keys from make_key
+        Returns: found (dictionary) - key to list of entities for keys in cache
+        """
+        found = {}
+        unique_keys = list(set(keys))
+        # query in chunks to stay under SQLite variable limit
+        for i in range(0, len(unique_keys), 500):
+            chunk = unique_keys[i:i + 500]
+            query = "SELECT key, ents FROM entities WHERE key IN ({})".format(",".join("?" * len(chunk)))
+            for key, ents in self.conn.execute(query, chunk):
+                found[key] = [tuple(ent) for ent in json.loads(ents)]
+
+        # mark entries as used
+        now = time.time()
+        self.conn.executemany("UPDATE entities SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+        self.conn.commit()
+
+        self.hits += sum(1 for key in keys if key in found)
+        self.misses += sum(1 for key in keys if key not in found)
+
+        return found
+
+    def put_many(self, items):
+        """
+        Store entities of several abstracts and evict old entries over the size cap.
+
+        Input: items (dictionary) - key to list of entities
+        """
+        now = time.time()
+        self.conn.executemany("INSERT OR REPLACE INTO entities VALUES (?, ?, ?)",
+                              [(key, json.dumps(ents), now) for key, ents in items.items()])
+
+        # evict least recently used entries
+        count = self.conn.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute("DELETE FROM entities WHERE key IN (SELECT key FROM entities ORDER BY last_used LIMIT ?)",
+                              (count - self.max_entries,))
+        self.conn.commit()
+
+    def report(self):
+        """
+        Print cache hits and misses.
+        """
+        print("NER cache hits: {}, misses: {}".format(self.hits, self.misses), flush = True)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,139 @@
+"""
+Purpose: Score publications with the classifier exported by export_classifier.py, using NumPy and SciPy only.
+
+Gives the same predictions and probabilities as the pickled TFIDF vectorizer and SGD classifier
+(word analyzer, log loss) without importing sklearn.
+"""
+
+import json
+import os
+import re
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.special import expit
+
+# folder of exported classifier
+artifact_folder = "models/classifier/numpy"
+
+def load_artifact(folder=artifact_folder, mmap=False):
+    """
+    Load exported classifier.
+
+    Input: folder (string) - folder written by export_classifier.py
+           mmap (bool) - memory-map the arrays instead of reading them into memory
+    Returns: model (dictionary) - vectorizer settings, vocabulary, idf, coefficients, intercept and classes
+    """
+    with open(os.path.join(folder, "params.json")) as f:
+        model = json.load(f)
+
+    mmap_mode = "r" if mmap else None
+    for name in ["vocabulary", "idf", "coef", "intercept", "classes"]:
+        model[name] = np.load(os.path.join(folder, name + ".npy"), mmap_mode=mmap_mode)
+
+    # lookups used when encoding text
+    model["vocabulary"] = {term: index for index, term in enumerate(model["vocabulary"].tolist())}
+    model["token_pattern"] = re.compile(model["token_pattern"])
+    model["stop_words"] = frozenset(model["stop_words"])
+
+    return model
+
+def transform(model, texts):
+    """
+    Encode text as TFIDF like TfidfVectorizer.transform.
+
+    Input: model (dictionary) - from load_artifact
+           texts (list) - cleaned text
+    Returns: encoded_text (sparse matrix)
+    """
+    vocabulary = model["vocabulary"]
+    stop_words = model["stop_words"]
+    token_pattern = model["token_pattern"]
+
+    indices = []
+    counts = []
+    indptr = [0]
+    for text in texts:
+        if model["lowercase"]:
+            text = text.lower()
+        # count terms in vocabulary
+        doc_counts = {}
+        for token in token_pattern.findall(text):
+            if token in stop_words:
+                continue
+            index = vocabulary.get(token)
+            if index is not None:
+                doc_counts[index] = doc_counts.get(index, 0) + 1
+        # column indices in descending order within each row, the order the sparse product with the idf diagonal
+        # leaves them in, so row norms and scores are summed in the same order as TfidfVectorizer
+        for index in sorted(doc_counts, reverse=True):
+            indices.append(index)
+            counts.append(doc_counts[index])
+        indptr.append(len(indices))
+
+    data = np.asarray(counts, dtype=np.float64)
+    indices = np.asarray(indices, dtype=np.int32)
+    indptr = np.asarray(indptr, dtype=np.int64)
+
+    # term frequency weighting
+    if model["sublinear_tf"]:
+        np.log(data, data)
+        data += 1
+    if model["use_idf"]:
+        data *= model["idf"][indices]
+
+    # normalize each row
+    if model["norm"] == "l2":
+        rows = np.repeat(np.arange(len(texts)), np.diff(indptr))
+        row_norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=len(texts)))
+        # empty rows are left as they are
+        row_norms[row_norms == 0] = 1
+        data /= row_norms[rows]
+    elif model["norm"] is not None:
+        raise ValueError("Unsupported norm: {}".format(model["norm"]))
+
+    return csr_matrix((data, indices, indptr), shape=(len(texts), len(vocabulary)))
+
+def decision_function(model, encoded_text):
+    """
+    Get decision function like SGDClassifier.decision_function for a binary classifier.
+
+    Input: model (dictionary) - from load_artifact
+           encoded_text (sparse matrix) - from transform
+    Returns: scores (array)
+    """
+    return (encoded_text @ model["coef"].T + model["intercept"]).ravel()
+
+def labels_and_probabilities(loss, classes, scores):
+    """
+    Get predicted labels and probabilities of a binary SGD classifier from its decision function.
+
+    Input: loss (string) - loss of classifier
+           classes (array) - class labels
+           scores (array) - decision function
+    Returns: predictions (array), probabilities (array) - one column per class
+    """
+    # same as SGDClassifier.predict_proba
+    if loss == "log":
+        prob = expit(scores)
+    elif loss == "modified_huber":
+        prob = (np.clip(scores, -1, 1) + 1) / 2.0
+    else:
+        raise ValueError("Probabilities are not available for loss {}".format(loss))
+    probabilities = np.vstack([1 - prob, prob]).T
+
+    # same as SGDClassifier.predict
+    predictions = classes[(scores > 0).astype(int)]
+
+    return predictions, probabilities
+
+def score(model, texts):
+    """
+    Get predicted labels and probabilities, computing the decision function once.
+
+    Input: model (dictionary) - from load_artifact
+           texts (list) - cleaned text
+    Returns: predictions (array), probabilities (array) - one column per class
+    """
+    scores = decision_function(model, transform(model, texts))
+
+    return labels_and_probabilities(model["loss"], model["classes"], scores)
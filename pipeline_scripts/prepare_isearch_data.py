@@ -3,8 +3,6 @@ Purpose: Prepare iSearch results for dashboard.
 """
 
 import re
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import SGDClassifier
 import numpy as np
 import pickle
 import pandas as pd
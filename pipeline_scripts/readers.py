@@ -0,0 +1,272 @@
+"""
+Reading iSearch publication data from excel, CSV, Parquet and JSON lines files.
+"""
+
+import os
+import glob
+import pandas as pd
+
+# columns of iSearch data used by the pipeline
+used_columns = ["System ID", "Title", "Abstract", "DOI", "PMID"]
+
+# file extensions of each format
+formats = {".xlsx": "excel", ".xlsm": "excel", ".xls": "excel", ".csv": "csv", ".parquet": "parquet",
+           ".jsonl": "jsonl", ".json": "jsonl"}
+
+def validate_columns(columns):
+    """
+    Check that data has the iSearch columns used by the pipeline.
+
+    Input: columns (list) - column names
+    Raises: ValueError if a column is missing
+    """
+    if "System ID" not in columns:
+        raise ValueError("This is not an iSearch file. Exiting...")
+
+    missing = [col for col in used_columns if col not in columns]
+    if len(missing) > 0:
+        raise ValueError("iSearch file is missing columns: {}. Exiting...".format(", ".join(missing)))
+
+def get_format(path):
+    """
+    Get format of publication file from its extension.
+
+    Input: path (string) - path to publication file
+    Returns: file_format (string)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in formats:
+        raise ValueError("Unsupported file type {}. Use one of: {}".format(extension, ", ".join(sorted(formats))))
+
+    return formats[extension]
+
+def select_columns(columns, all_columns=False):
+    """
+    Get columns to load, in file order.
+
+    Input: columns (list) - column names in file
+           all_columns (bool) - load every column, not only the ones used by the pipeline
+    Returns: columns (list)
+    """
+    validate_columns(columns)
+
+    if all_columns:
+        return list(columns)
+
+    return [col for col in columns if col in used_columns]
+
+def read_publications(path, all_columns=False):
+    """
+    Read publication file.
+
+    Input: path (string) - path to publication file
+           all_columns (bool) - load every column, not only the ones used by the pipeline
+    Returns: df (dataframe)
+    """
+    file_format = get_format(path)
+
+    if file_format == "excel":
+        # workbook is parsed whole even for the header, so read it once and check the columns read
+        df = pd.read_excel(path, usecols=None if all_columns else lambda col: col in used_columns)
+        validate_columns(df.columns)
+        return df
+
+    if file_format == "csv":
+        columns = select_columns(pd.read_csv(path, nrows=0).columns, all_columns)
+        return pd.read_csv(path, usecols=lambda col: col in columns)
+
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+        columns = select_columns(pq.ParquetFile(path).schema.names, all_columns)
+        return pd.read_parquet(path, columns=columns)
+
+    # JSON lines can only be selected after reading
+    df = pd.read_json(path, lines=True)
+    return df[select_columns(df.columns, all_columns)]
+
+def iter_publications(path, chunksize, all_columns=False):
+    """
+    Read publication file in chunks of rows. Excel files are streamed with openpyxl in read-only mode.
+
+    Input: path (string) - path to publication file
+           chunksize (int) - number of rows per chunk
+           all_columns (bool) - load every column, not only the ones used by the pipeline
+    Returns: chunks (generator) - dataframes of at most chunksize rows
+    """
+    file_format = get_format(path)
+
+    if file_format == "excel" and not path.lower().endswith(".xls"):
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = list(next(rows, []))
+            columns = select_columns(header, all_columns)
+            positions = [header.index(col) for col in columns]
+
+            chunk = []
+            for row in rows:
+                # skip empty rows at the end of sheet
+                if all(value is None for value in row):
+                    continue
+                chunk.append([row[i] if i < len(row) else None for i in positions])
+                if len(chunk) == chunksize:
+                    yield pd.DataFrame(chunk, columns=columns)
+                    chunk = []
+            if len(chunk) > 0:
+                yield pd.DataFrame(chunk, columns=columns)
+        finally:
+            workbook.close()
+
+    elif file_format == "csv":
+        columns = select_columns(pd.read_csv(path, nrows=0).columns, all_columns)
+        for chunk in pd.read_csv(path, usecols=lambda col: col in columns, chunksize=chunksize):
+            yield chunk
+
+    elif file_format == "parquet":
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        columns = select_columns(parquet_file.schema.names, all_columns)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+
+    elif file_format == "jsonl":
+        columns = None
+        for chunk in pd.read_json(path, lines=True, chunksize=chunksize):
+            if columns is None:
+                columns = select_columns(chunk.columns, all_columns)
+            yield chunk[columns]
+
+    else:
+        # old excel files can't be streamed
+        df = read_publications(path, all_columns)
+        for i in range(0, df.shape[0], chunksize):
+            yield df.iloc[i:i + chunksize]
+
+def expand_input(path):
+    """
+    Get publication files of an input, which can be a file, a folder or a glob pattern such as exports/*.xlsx.
+
+    Input: path (string) - file, folder or glob pattern
+    Returns: paths (list) - publication files in name order
+    """
+    if os.path.isfile(path):
+        return [path]
+
+    if os.path.isdir(path):
+        paths = [os.path.join(path, name) for name in os.listdir(path)]
+    else:
+        paths = glob.glob(path)
+
+    # only files of supported formats, skipping temporary excel files
+    paths = sorted(p for p in paths if os.path.isfile(p) and os.path.splitext(p)[1].lower() in formats
+                   and not os.path.basename(p).startswith("~$"))
+    if len(paths) == 0:
+        raise ValueError("No publication files found in {}. Exiting...".format(path))
+
+    return paths
+
+def is_batch(path):
+    """
+    Check if input is a folder or glob pattern rather than one file.
+    """
+    return not os.path.isfile(path)
+
+class Deduplicator:
+    """
+    Drop publications seen before by System ID, DOI or PMID, across files or chunks.
+
+    A publication is dropped if its System ID, DOI or PMID is the same as the one of a publication already kept.
+    DOIs are compared without case and PMIDs as numbers; missing DOIs and PMIDs never match.
+    """
+
+    def __init__(self):
+        self.seen = {"System ID": set(), "DOI": set(), "PMID": set()}
+        self.dropped = {"System ID": 0, "DOI": 0, "PMID": 0}
+
+    @staticmethod
+    def keys(df):
+        """
+        Get normalized System IDs, DOIs and PMIDs, None where missing.
+        """
+        sys_ids = df["System ID"].astype(str).tolist()
+        dois = [str(doi).strip().lower() or None if pd.notnull(doi) else None for doi in df["DOI"]]
+        pmids = pd.to_numeric(df["PMID"], errors="coerce")
+        pmids = [str(int(pmid)) if pd.notnull(pmid) else None for pmid in pmids]
+
+        return zip(sys_ids, dois, pmids)
+
+    def filter(self, df):
+        """
+        Drop publications seen before or earlier in df.
+
+        Input: df (dataframe) - publication data
+        Returns: df (dataframe) - publications not seen before, in their original order
+        """
+        keep = []
+        for sys_id, doi, pmid in self.keys(df):
+            if sys_id in self.seen["System ID"]:
+                self.dropped["System ID"] += 1
+                keep.append(False)
+            elif doi is not None and doi in self.seen["DOI"]:
+                self.dropped["DOI"] += 1
+                keep.append(False)
+            elif pmid is not None and pmid in self.seen["PMID"]:
+                self.dropped["PMID"] += 1
+                keep.append(False)
+            else:
+                self.seen["System ID"].add(sys_id)
+                if doi is not None:
+                    self.seen["DOI"].add(doi)
+                if pmid is not None:
+                    self.seen["PMID"].add(pmid)
+                keep.append(True)
+
+        return df[keep]
+
+    def report(self):
+        """
+        Print number of duplicates dropped.
+        """
+        print("Dropped duplicate publications: {} by System ID, {} by DOI, {} by PMID.".format(
+              self.dropped["System ID"], self.dropped["DOI"], self.dropped["PMID"]), flush = True)
+
+def read_batch(path, all_columns=False):
+    """
+    Read all publication files of a folder or glob pattern and drop duplicate publications.
+
+    Input: path (string) - folder or glob pattern
+           all_columns (bool) - load every column, not only the ones used by the pipeline
+    Returns: df (dataframe) - publications of all files, first occurrence of each kept
+    """
+    dedup = Deduplicator()
+
+    dfs = []
+    for file_path in expand_input(path):
+        df = read_publications(file_path, all_columns)
+        dfs.append(dedup.filter(df))
+        print("Read {} publications from {}.".format(df.shape[0], file_path), flush = True)
+
+    dedup.report()
+
+    return pd.concat(dfs, ignore_index=True)
+
+def iter_batch(path, chunksize, all_columns=False):
+    """
+    Read all publication files of a folder or glob pattern in chunks of rows and drop duplicate publications.
+
+    Input: path (string) - folder or glob pattern
+           chunksize (int) - number of rows read at a time, chunks are smaller after duplicates are dropped
+           all_columns (bool) - load every column, not only the ones used by the pipeline
+    Returns: chunks (generator) - dataframes of publications not seen before
+    """
+    dedup = Deduplicator()
+
+    for file_path in expand_input(path):
+        print("Reading {}...".format(file_path), flush = True)
+        for chunk in iter_publications(file_path, chunksize, all_columns):
+            chunk = dedup.filter(chunk)
+            if chunk.shape[0] > 0:
+                yield chunk
+
+    dedup.report()
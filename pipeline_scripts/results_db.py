@@ -0,0 +1,195 @@
+"""
+SQLite results database for dashboard queries: publications, entities and categories in normalized, indexed tables
+that are updated in place across runs, with views of common aggregates.
+"""
+
+import sqlite3
+import time
+import pandas as pd
+
+schema = """
+CREATE TABLE IF NOT EXISTS publications (
+    system_id TEXT PRIMARY KEY,
+    title TEXT,
+    abstract TEXT,
+    doi TEXT,
+    pmid TEXT,
+    probability REAL,
+    clinical_trial_id TEXT,
+    link_to_trial TEXT,
+    link_to_doi TEXT,
+    link_to_pubmed TEXT,
+    updated REAL
+);
+
+CREATE TABLE IF NOT EXISTS entities (
+    entity_id INTEGER PRIMARY KEY,
+    system_id TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    class TEXT NOT NULL,
+    start_char INTEGER,
+    end_char INTEGER,
+    UNIQUE (system_id, entity)
+);
+
+CREATE TABLE IF NOT EXISTS categories (
+    entity_id INTEGER NOT NULL REFERENCES entities (entity_id),
+    category TEXT,
+    PRIMARY KEY (entity_id, category)
+);
+
+CREATE INDEX IF NOT EXISTS entities_system_id ON entities (system_id);
+CREATE INDEX IF NOT EXISTS entities_class ON entities (class);
+CREATE INDEX IF NOT EXISTS categories_category ON categories (category);
+
+-- entities with their categories and publication
+CREATE VIEW IF NOT EXISTS entity_categories AS
+    SELECT e.system_id, p.title, p.doi, p.pmid, e.entity, e.class, c.category
+    FROM entities e
+    JOIN categories c ON c.entity_id = e.entity_id
+    LEFT JOIN publications p ON p.system_id = e.system_id;
+
+-- number of publications and mentions of each category
+CREATE VIEW IF NOT EXISTS category_counts AS
+    SELECT e.class, c.category, COUNT(DISTINCT e.system_id) AS publications, COUNT(*) AS mentions
+    FROM entities e
+    JOIN categories c ON c.entity_id = e.entity_id
+    GROUP BY e.class, c.category;
+
+-- number of publications mentioning each class
+CREATE VIEW IF NOT EXISTS class_counts AS
+    SELECT class, COUNT(DISTINCT system_id) AS publications, COUNT(*) AS entities
+    FROM entities
+    GROUP BY class;
+
+-- most frequent entity texts of each class
+CREATE VIEW IF NOT EXISTS entity_counts AS
+    SELECT class, entity, COUNT(DISTINCT system_id) AS publications
+    FROM entities
+    GROUP BY class, entity;
+
+-- pairs of categories mentioned in the same publication, e.g. vaccine type and correlate
+CREATE VIEW IF NOT EXISTS category_pairs AS
+    SELECT a.class AS class_1, a.category AS category_1, b.class AS class_2, b.category AS category_2,
+           COUNT(DISTINCT a.system_id) AS publications
+    FROM entity_categories a
+    JOIN entity_categories b ON a.system_id = b.system_id AND a.class < b.class
+    GROUP BY a.class, a.category, b.class, b.category;
+"""
+
+def value(x):
+    """
+    Convert missing values to None and numpy numbers to python numbers for sqlite.
+    """
+    if x is None:
+        return None
+    if isinstance(x, float) and x != x:
+        return None
+    if hasattr(x, "item"):
+        return x.item()
+
+    return x
+
+class ResultsDB:
+    """
+    Results database. Results of a publication replace its results from earlier runs.
+    """
+
+    def __init__(self, path):
+        """
+        Input: path (string) - path to SQLite file, created if missing
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(schema)
+
+    def write_publications(self, df):
+        """
+        Insert or update publications.
+
+        Input: df (dataframe) - processed publications from prepare_isearch_data.process_data
+        """
+        now = time.time()
+        columns = ["Title", "Abstract", "DOI", "PMID", "probability", "Clinical_Trial_ID", "Link_to_trial", "Link_to_DOI", "Link_to_PubMed"]
+        # columns of relevant table not processed yet
+        df = df.rename(columns={"System ID": "System_ID"}).reindex(columns=["System_ID"] + columns)
+
+        rows = [(str(row[0]),) + tuple(value(x) for x in row[1:]) + (now,) for row in df.itertuples(index=False, name=None)]
+        self.conn.executemany("INSERT OR REPLACE INTO publications VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def write_entities(self, entity_df, categories_df=None, sys_ids=None):
+        """
+        Replace entities and categories of the publications in entity_df.
+
+        Input: entity_df (dataframe) - entities from ner.get_entities
+               categories_df (dataframe) - categorized entities, None to keep categories of earlier runs
+               sys_ids (list) - other publications run through NER, their entities of earlier runs are removed
+        """
+        sys_ids = sorted(set(str(x) for x in entity_df["System_ID"]) | set(str(x) for x in (sys_ids or [])))
+        self.conn.executemany("DELETE FROM categories WHERE entity_id IN (SELECT entity_id FROM entities WHERE system_id = ?)",
+                              [(sys_id,) for sys_id in sys_ids])
+        self.conn.executemany("DELETE FROM entities WHERE system_id = ?", [(sys_id,) for sys_id in sys_ids])
+
+        rows = [(str(row.System_ID), row.Entity, row.Class, value(row.Start), value(row.End))
+                for row in entity_df[["System_ID", "Entity", "Class", "Start", "End"]].itertuples(index=False)]
+        self.conn.executemany("INSERT OR REPLACE INTO entities (system_id, entity, class, start_char, end_char) VALUES (?, ?, ?, ?, ?)", rows)
+
+        if categories_df is not None:
+            self.write_categories(categories_df)
+
+    def write_categories(self, categories_df):
+        """
+        Replace categories of the entities in categories_df.
+
+        Input: categories_df (dataframe) - categorized entities with System_ID, Entity and Category
+        """
+        # ids of entities of the publications, a few hundred publications at a time
+        sys_ids = sorted(set(str(x) for x in categories_df["System_ID"]))
+        ids = {}
+        for i in range(0, len(sys_ids), 500):
+            batch = sys_ids[i:i + 500]
+            for entity_id, system_id, entity in self.conn.execute(
+                    "SELECT entity_id, system_id, entity FROM entities WHERE system_id IN ({})".format(",".join("?" * len(batch))), batch):
+                ids[(system_id, entity)] = entity_id
+
+        rows = []
+        for row in categories_df[["System_ID", "Entity", "Category"]].itertuples(index=False):
+            entity_id = ids.get((str(row.System_ID), row.Entity))
+            if entity_id is not None:
+                rows.append((entity_id, value(row.Category)))
+
+        self.conn.executemany("DELETE FROM categories WHERE entity_id = ?", sorted(set((row[0],) for row in rows)))
+        self.conn.executemany("INSERT OR IGNORE INTO categories VALUES (?, ?)", rows)
+
+    def write(self, tables):
+        """
+        Write result tables of a run.
+
+        Input: tables (dictionary) - relevant, processed, entities and categories dataframes, tables of stages not run may be missing
+        """
+        if "processed" in tables:
+            self.write_publications(tables["processed"])
+        elif "relevant" in tables:
+            self.write_publications(tables["relevant"])
+
+        if "entities" in tables:
+            # publications run through NER without entities lose entities of earlier runs too
+            sys_ids = tables["processed"]["System_ID"].tolist() if "processed" in tables else None
+            self.write_entities(tables["entities"], tables.get("categories"), sys_ids)
+        elif "categories" in tables:
+            self.write_categories(tables["categories"])
+
+        self.conn.commit()
+
+    def query(self, sql, params=()):
+        """
+        Run a query.
+
+        Input: sql (string) - query, e.g. SELECT * FROM category_counts
+               params (tuple) - query parameters
+        Returns: df (dataframe)
+        """
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def close(self):
+        self.conn.close()
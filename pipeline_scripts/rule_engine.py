@@ -0,0 +1,246 @@
+"""
+Categorizing entities with the regex rules in rules/<class>.json, compiled once and applied to all entities of a class at a time.
+
+A rule file has the entity class, a version (raise it when rules change), whether an entity only gets its first matching
+category (first_match), the category of entities matching no rule (unmatched_category) and one or more passes of rules.
+Each rule has a name, a category and a pattern, which matches an entity if re.search finds it anywhere in the entity.
+Entities matching no rule of a pass are sent to the next pass. Categories depend only on the entity text, so each
+distinct text is matched once.
+
+With first_match each entity is tested with the rules in order until one matches, and a rule is only run on entities
+containing one of the literals its pattern needs (see literal_prefilter).
+"""
+
+import json
+import re
+try:
+    # parser modules moved in python 3.11
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+import numpy as np
+import pandas as pd
+
+# folder of rule files
+rules_folder = "rules"
+
+# compiled rules of each file
+loaded = {}
+
+def load_rules(path):
+    """
+    Read rule file and compile its patterns.
+
+    Input: path (string) - path to rule file
+    Returns: rules (dictionary) - rule file with compiled pattern of each rule in "regex",
+                                  and with first_match the literals of its pattern in "literals"
+    """
+    with open(path, encoding="utf-8") as f:
+        rules = json.load(f)
+
+    for rule_pass in rules["passes"]:
+        for rule in rule_pass["rules"]:
+            rule["regex"] = re.compile(rule["pattern"])
+            if rules["first_match"]:
+                rule["literals"] = literal_prefilter(rule["pattern"])
+
+    return rules
+
+def fixed_text(op, av):
+    """
+    Get text matched by a part of a parsed pattern if it is a literal character or a class of one letter in either case.
+
+    Input: op, av - opcode and argument of the part from sre_parse
+    Returns: text (string) - case folded, None if the part can match other text
+    """
+    if op is sre_constants.LITERAL:
+        return chr(av).casefold()
+    if op is sre_constants.IN and all(item_op is sre_constants.LITERAL for item_op, _ in av):
+        folded = set(chr(code).casefold() for _, code in av)
+        if len(folded) == 1:
+            return folded.pop()
+
+    return None
+
+def required_literals(items):
+    """
+    Find literals one of which is in any text a parsed pattern matches.
+
+    Input: items (list) - parsed pattern or subpattern from sre_parse
+    Returns: literals (set) - case folded, None if there are none
+    """
+    candidates = []
+
+    # runs of literal characters, and literals of groups, alternatives and repeats that must match
+    run = ""
+    for op, av in items:
+        text = fixed_text(op, av)
+        if text is not None:
+            run += text
+            continue
+        if run:
+            candidates.append({run})
+            run = ""
+
+        literals = None
+        if op is sre_constants.SUBPATTERN:
+            # not in case insensitive groups
+            if not av[1] & (re.IGNORECASE | re.LOCALE):
+                literals = required_literals(av[-1])
+        elif op is sre_constants.BRANCH:
+            # every alternative needs literals
+            alternatives = [required_literals(alternative) for alternative in av[1]]
+            if all(alternatives):
+                literals = set().union(*alternatives)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+            literals = required_literals(av[2])
+        if literals:
+            candidates.append(literals)
+    if run:
+        candidates.append({run})
+
+    if not candidates:
+        return None
+
+    # a literal containing another literal of the set adds nothing
+    candidates = [set(literal for literal in literals if not any(other != literal and other in literal for other in literals))
+                  for literals in candidates]
+
+    # keep the most selective: longest shortest literal, then fewest literals
+    return max(candidates, key=lambda literals: (min(len(literal) for literal in literals), -len(literals)))
+
+def literal_prefilter(pattern):
+    """
+    Get literals to test before running a pattern, an entity without any of them can not match it.
+
+    Input: pattern (string) - regex of a rule
+    Returns: literals (tuple) - case folded, test against the case folded entity, None if the pattern has none
+    """
+    # literals of case insensitive patterns are not reliable
+    if re.compile(pattern).flags & (re.IGNORECASE | re.LOCALE):
+        return None
+
+    literals = required_literals(sre_parse.parse(pattern))
+
+    return tuple(sorted(literals)) if literals else None
+
+def get_rules(ent_class):
+    """
+    Get compiled rules of an entity class, loaded once.
+
+    Input: ent_class (string) - animal, assay or correlate
+    Returns: rules (dictionary)
+    """
+    if ent_class not in loaded:
+        loaded[ent_class] = load_rules("{}/{}.json".format(rules_folder, ent_class))
+
+    return loaded[ent_class]
+
+def match_matrix(entities, rules, first_match=False):
+    """
+    Test every rule on every entity.
+
+    Input: entities (list) - entity text
+           rules (list) - compiled rules of a pass
+           first_match (bool) - keep only the first matching rule of each entity
+    Returns: matches (array) - boolean, one row per entity and one column per rule
+    """
+    matches = np.zeros((len(entities), len(rules)), dtype=bool)
+    for j, rule in enumerate(rules):
+        search = rule["regex"].search
+        matches[:, j] = [search(entity) is not None for entity in entities]
+
+    if first_match:
+        # first True of each row only
+        first = matches.argmax(axis=1)
+        matched = matches.any(axis=1)
+        matches = np.zeros_like(matches)
+        matches[matched, first[matched]] = True
+
+    return matches
+
+def first_match_matrix(entities, rules):
+    """
+    Find the first matching rule of every entity, testing rules in order and stopping at the first match.
+
+    Gives the same matches as match_matrix with first_match.
+
+    Input: entities (list) - entity text
+           rules (list) - compiled rules of a pass with their literals
+    Returns: matches (array) - boolean, one row per entity and one column per rule, True for the first matching rule
+    """
+    checks = [(j, rule["regex"].search, rule["literals"]) for j, rule in enumerate(rules)]
+
+    matches = np.zeros((len(entities), len(rules)), dtype=bool)
+    for i, entity in enumerate(entities):
+        folded = entity.casefold()
+        for j, search, literals in checks:
+            # skip rules whose literals are not in entity
+            if literals is not None and not any(literal in folded for literal in literals):
+                continue
+            if search(entity) is not None:
+                matches[i, j] = True
+                break
+
+    return matches
+
+def categorize_entities(entities, rules):
+    """
+    Categorize entity texts with each pass of rules, texts not categorized by a pass go on to the next pass.
+
+    Input: entities (list) - distinct entity texts
+           rules (dictionary) - from load_rules
+    Returns: categories (dictionary) - entity text to its categories in rule order
+    """
+    categories = {}
+
+    remaining = list(entities)
+    for rule_pass in rules['passes']:
+        if rules['first_match']:
+            matches = first_match_matrix(remaining, rule_pass['rules'])
+        else:
+            matches = match_matrix(remaining, rule_pass['rules'])
+        for entity, row in zip(remaining, matches):
+            if row.any():
+                categories[entity] = [rule_pass['rules'][j]['category'] for j in np.flatnonzero(row)]
+        remaining = [entity for entity in remaining if entity not in categories]
+
+    # texts matching no rule
+    for entity in remaining:
+        categories[entity] = [rules['unmatched_category']]
+
+    return categories
+
+def categorize(df, rules, memo=None):
+    """
+    Filter entities to the class of the rules and categorize them.
+
+    Each distinct entity text is categorized once and its categories are joined back to all rows with that text.
+
+    Input: df (dataframe) - uncategorized entities
+           rules (dictionary) - from load_rules
+           memo (dictionary) - categories of entity texts categorized before with the same rules, texts not in it are
+                               categorized and added to it
+    Returns: final (dataframe) - entities of the class with their categories
+    """
+    ents = df[df.Class == rules['class']]
+
+    if memo is None:
+        memo = {}
+
+    '''Categorizing entity texts not categorized before'''
+    entities = ents['Entity'].unique().tolist()
+    memo.update(categorize_entities([entity for entity in entities if entity not in memo], rules))
+
+    '''Joining categories back to entities, one row per category of each entity'''
+    categories = pd.DataFrame({'Entity': [entity for entity in entities for _ in memo[entity]],
+                               'Category': [category for entity in entities for category in memo[entity]]},
+                              dtype=object)
+    # every text has a category, left merge keeps the order of the rows
+    concat = ents[['System_ID', 'Entity']].merge(categories, on='Entity', how='left')
+
+    final = ents.merge(concat, on=['System_ID', 'Entity'], how='left')
+
+    return final
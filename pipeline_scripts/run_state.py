@@ -0,0 +1,199 @@
+"""
+Run state for incremental runs: which System_IDs have been classified, run through NER and categorized,
+and with which model and rule versions, plus the result tables of the previous run.
+"""
+
+import hashlib
+import os
+import sqlite3
+import pandas as pd
+import pipeline_scripts.ner_cache as ner_cache
+
+# files each stage depends on
+classifier_files = ["models/classifier/sgd_l2.pkl", "models/classifier/tfidf.pkl", "models/classifier/numpy",
+                    "pipeline_scripts/classifier.py", "pipeline_scripts/numpy_classifier.py",
+                    "pipeline_scripts/prepare_isearch_data.py"]
+ner_files = ["pipeline_scripts/ner.py"]
+rules_files = ["pipeline_scripts/clean_animal_entities.py", "pipeline_scripts/clean_assay_entities.py",
+               "pipeline_scripts/clean_correlate_entities.py", "pipeline_scripts/clean_vaccine_entities.py",
+               "pipeline_scripts/rule_engine.py", "rules",
+               "data/COVID_19_Tracker_Vaccines_01262021.csv"]
+
+# result tables kept between runs and the column holding the System ID in each
+tables = {"relevant": "System ID", "processed": "System_ID", "entities": "System_ID", "categories": "System_ID"}
+
+def file_version(paths, extra=""):
+    """
+    Hash contents of files and folders.
+
+    Input: paths (list) - files or folders
+           extra (string) - other settings the version depends on
+    Returns: version (string)
+    """
+    sha = hashlib.sha1(extra.encode("utf-8"))
+    for path in paths:
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, dirs, names in os.walk(path) for name in names)
+        for name in files:
+            if os.path.exists(name):
+                sha.update(name.encode("utf-8"))
+                with open(name, "rb") as f:
+                    sha.update(f.read())
+
+    return sha.hexdigest()
+
+def stage_versions(ner_model_dir, ner_profile, sentences):
+    """
+    Get current versions of classifier, NER model and categorization rules.
+
+    Input: ner_model_dir (string) - folder of NER model
+           ner_profile (string) - NER model profile
+           sentences (bool) - sentence offsets added to entities
+    Returns: versions (dictionary) - classifier, ner and rules versions
+    """
+    ner_settings = "{} {} {}".format(ner_cache.model_version(ner_model_dir), ner_profile, sentences)
+
+    return {"classifier": file_version(classifier_files),
+            "ner": file_version(ner_files, ner_settings),
+            "rules": file_version(rules_files)}
+
+def text_hashes(df):
+    """
+    Hash title and abstract of each publication.
+
+    Input: df (dataframe) - iSearch publication data
+    Returns: hashes (series) - hash per publication
+    """
+    text = df["Title"].astype(str) + "\0" + df["Abstract"].astype(str)
+
+    return text.apply(lambda x: hashlib.sha1(x.encode("utf-8")).hexdigest())
+
+class RunState:
+    """
+    SQLite record of each System_ID and pickled result tables, kept in a state folder.
+    """
+
+    def __init__(self, state_dir):
+        """
+        Input: state_dir (string) - folder to keep run state in
+        """
+        self.state_dir = state_dir
+        if not os.path.exists(state_dir):
+            os.makedirs(state_dir)
+
+        self.conn = sqlite3.connect(os.path.join(state_dir, "run_state.sqlite"))
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS records (
+                                 system_id TEXT PRIMARY KEY,
+                                 text_hash TEXT,
+                                 classifier_version TEXT,
+                                 relevant INTEGER,
+                                 ner_version TEXT,
+                                 rules_version TEXT)""")
+        self.conn.commit()
+
+    def plan(self, ids, hashes, versions):
+        """
+        Find publications whose results are missing or out of date.
+
+        Input: ids (list) - System IDs (string) of publications in input
+               hashes (list) - text hash of each publication
+               versions (dictionary) - current classifier, ner and rules versions
+        Returns: classify_ids (set) - new or changed publications, or classified with another classifier version
+                 ner_ids (set) - relevant publications run through another NER version, or not run through NER
+                 categorize_ids (set) - relevant publications categorized with other rules
+        """
+        records = {row[0]: row[1:] for row in self.conn.execute(
+            "SELECT system_id, text_hash, classifier_version, relevant, ner_version, rules_version FROM records")}
+
+        classify_ids = set()
+        for sys_id, text_hash in zip(ids, hashes):
+            record = records.get(sys_id)
+            if record is None or record[0] != text_hash or record[1] != versions["classifier"]:
+                classify_ids.add(sys_id)
+
+        # publications from earlier runs are updated too, their results are in the saved tables
+        ner_ids = set()
+        categorize_ids = set()
+        for sys_id, (text_hash, classifier_version, relevant, ner_version, rules_version) in records.items():
+            if sys_id in classify_ids or not relevant:
+                continue
+            if ner_version != versions["ner"]:
+                ner_ids.add(sys_id)
+            elif rules_version != versions["rules"]:
+                categorize_ids.add(sys_id)
+
+        return classify_ids, ner_ids, categorize_ids
+
+    def record_classified(self, ids, hashes, relevant_ids, version):
+        """
+        Record classified publications, their NER and categories are reset.
+        """
+        self.conn.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, NULL, NULL)",
+                              [(sys_id, text_hash, version, int(sys_id in relevant_ids)) for sys_id, text_hash in zip(ids, hashes)])
+        self.conn.commit()
+
+    def record_stage(self, column, ids, version):
+        """
+        Record publications run through NER (column ner_version) or categorized (column rules_version).
+        """
+        self.conn.executemany("UPDATE records SET {} = ? WHERE system_id = ?".format(column),
+                              [(version, sys_id) for sys_id in ids])
+        self.conn.commit()
+
+    def load_tables(self):
+        """
+        Load result tables of previous run.
+
+        Returns: tables (dictionary) - dataframes, None for tables not saved yet
+        """
+        saved = {}
+        for name in tables:
+            path = os.path.join(self.state_dir, name + ".pkl")
+            saved[name] = pd.read_pickle(path) if os.path.exists(path) else None
+
+        return saved
+
+    def save_tables(self, results):
+        """
+        Save result tables for next run.
+
+        Input: results (dictionary) - result tables
+        """
+        for name in tables:
+            # replace whole file, so a failed save keeps the previous table
+            path = os.path.join(self.state_dir, name + ".pkl")
+            results[name].to_pickle(path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    def close(self):
+        self.conn.close()
+
+def drop_ids(df, name, ids):
+    """
+    Remove rows of publications from a saved result table.
+
+    Input: df (dataframe) - saved result table, None if not saved
+           name (string) - name of table
+           ids (set) - System IDs (string) to remove
+    Returns: df (dataframe) - None if not saved
+    """
+    if df is None:
+        return None
+
+    return df[~df[tables[name]].astype(str).isin(ids)]
+
+def keep_ids(df, name, ids):
+    """
+    Get rows of publications from a saved result table.
+    """
+    if df is None:
+        return None
+
+    return df[df[tables[name]].astype(str).isin(ids)]
+
+def merge(*dfs):
+    """
+    Concatenate result tables, skipping tables not saved yet.
+    """
+    return pd.concat([df for df in dfs if df is not None], ignore_index=True)
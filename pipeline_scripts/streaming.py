@@ -0,0 +1,122 @@
+"""
+Streaming runs: chunks of publications pass through the pipeline stages one at a time, with each stage in its own thread
+and bounded queues between stages, so stages overlap and only a few chunks are held in memory at once.
+"""
+
+import queue
+import threading
+import time
+
+# marks the end of the chunks
+end_of_stream = object()
+
+class Pipeline:
+    """
+    Stages connected by bounded queues, each run in a thread.
+
+    If a stage fails the other stages stop and the error is raised by run.
+    """
+
+    def __init__(self, stages, queue_size=2):
+        """
+        Input: stages (list) - (name, step, writer) of each stage in order, step takes the output of the previous stage
+                               and returns a dataframe, writer (TableWriter or None) gets the output of the stage
+               queue_size (int) - maximum number of chunks waiting between two stages
+        """
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.failed = threading.Event()
+        self.errors = []
+        # time taken and rows in and out of each stage
+        self.totals = {name: {"wall_seconds": 0.0, "cpu_seconds": 0.0, "rows_in": 0, "rows_out": 0} for name, _, _ in stages}
+
+    def put(self, q, item):
+        """
+        Put item in queue, waiting for space unless a stage failed.
+        """
+        while not self.failed.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def get(self, q):
+        """
+        Get item from queue, waiting for one unless a stage failed.
+        """
+        while not self.failed.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+        return end_of_stream
+
+    def run_stage(self, index):
+        """
+        Run one stage on each chunk from its queue until the end of the chunks.
+        """
+        name, step, writer = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        totals = self.totals[name]
+
+        try:
+            while True:
+                chunk = self.get(inbox)
+                if chunk is end_of_stream:
+                    break
+
+                wall_start = time.perf_counter()
+                cpu_start = time.thread_time()
+                result = step(chunk)
+                # empty chunks are only written if nothing was, so the file has a header
+                if writer is not None and (result.shape[0] > 0 or writer.columns is None):
+                    writer.write(result)
+                totals["wall_seconds"] += time.perf_counter() - wall_start
+                totals["cpu_seconds"] += time.thread_time() - cpu_start
+                totals["rows_in"] += chunk.shape[0]
+                totals["rows_out"] += result.shape[0]
+
+                if outbox is not None and not self.put(outbox, result):
+                    break
+        except BaseException as e:
+            self.errors.append(e)
+            self.failed.set()
+        finally:
+            if outbox is not None:
+                self.put(outbox, end_of_stream)
+
+    def run(self, chunks):
+        """
+        Send chunks through the stages.
+
+        Input: chunks (iterable) - dataframes
+        Returns: chunk_count (int) - number of chunks read
+        """
+        threads = [threading.Thread(target=self.run_stage, args=(i,), daemon=True) for i in range(len(self.stages))]
+        for thread in threads:
+            thread.start()
+
+        chunk_count = 0
+        try:
+            for chunk in chunks:
+                if not self.put(self.queues[0], chunk):
+                    break
+                chunk_count += 1
+        except BaseException as e:
+            # error reading chunks
+            self.errors.append(e)
+            self.failed.set()
+        finally:
+            self.put(self.queues[0], end_of_stream)
+            for thread in threads:
+                thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+        return chunk_count
@@ -0,0 +1,119 @@
+"""
+Resident pipeline worker that keeps the classifier, NER model and vaccine info loaded between runs.
+
+The worker listens on a localhost HTTP port. A job is a JSON object with either "input", the path to an
+iSearch file on the same machine, or "records", a list of publications with the iSearch columns, and "options",
+the pipeline options of the run (see job_options). Options of the loaded models are the ones the worker was started with.
+The response is the pickled dictionary of result tables, so only connect to a worker you started.
+"""
+
+import argparse
+import json
+import pickle
+import traceback
+import urllib.error
+import urllib.request
+import pandas as pd
+import pipeline_scripts.readers as readers
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# pipeline options set by each job
+job_options = ["all_columns", "n_jobs", "classify_chunk_size", "min_probability", "top_k", "ner_budget", "ner_docs_per_sec",
+               "clean_processes", "batch_size", "n_process", "ner_profile", "sort_by_length", "check_ner_profile",
+               "sentences", "save_docs", "reuse_docs"]
+
+# options of the models loaded when the worker starts, a job can not change them
+model_options = ["classifier_engine", "classifier_mmap", "ner_cache", "ner_cache_size", "category_memo"]
+
+def job_args(args, options):
+    """
+    Get pipeline options of a job.
+
+    Input: args (argparse.Namespace) - options the worker was started with
+           options (dictionary) - options of the job, see job_options
+    Returns: args (argparse.Namespace) - options the worker was started with, replaced by the options of the job
+    """
+    unknown = [name for name in options if name not in job_options]
+    if unknown:
+        raise ValueError("Unknown job options: {}".format(", ".join(unknown)))
+
+    run_args = argparse.Namespace(**vars(args))
+    for name, value in options.items():
+        setattr(run_args, name, value)
+
+    # the NER model is loaded with the profile of the worker
+    if run_args.ner_profile != args.ner_profile:
+        raise ValueError("Worker runs the {} NER profile, start a worker with --ner-profile {}".format(
+                         args.ner_profile, run_args.ner_profile))
+
+    return run_args
+
+def serve(port, load_data, run, models, args):
+    """
+    Run worker until interrupted. Jobs are run one at a time with the same models.
+
+    Input: port (int) - localhost port to listen on
+           load_data (function) - reads a publication file into a dataframe, takes path and all_columns
+           run (function) - runs pipeline on a dataframe and returns dictionary of result tables
+           models (dictionary) - loaded models passed to run
+           args (argparse.Namespace) - pipeline options passed to run, options of each job replace them
+    """
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            try:
+                # read job
+                length = int(self.headers.get("Content-Length", 0))
+                job = json.loads(self.rfile.read(length).decode("utf-8"))
+                run_args = job_args(args, job.get("options", {}))
+
+                if "input" in job:
+                    df = load_data(job["input"], run_args.all_columns)
+                else:
+                    df = pd.DataFrame(job["records"])
+                    readers.validate_columns(df.columns)
+
+                print("Number of publications is {}.".format(df.shape[0]), flush = True)
+
+                # run pipeline with loaded models
+                body = pickle.dumps(run(df, run_args, models))
+                for name in ["cache", "category_memo"]:
+                    if models.get(name) is not None:
+                        models[name].report()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+            except (Exception, SystemExit) as e:
+                traceback.print_exc()
+                body = str(e).encode("utf-8")
+                self.send_response(500)
+                self.send_header("Content-Type", "text/plain")
+
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = HTTPServer(("127.0.0.1", port), Handler)
+    print("Worker listening on http://127.0.0.1:{}".format(port), flush = True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def submit(url, job):
+    """
+    Send a job to a running worker.
+
+    Input: url (string) - worker address, e.g. http://127.0.0.1:8765
+           job (dictionary) - {"input": path} or {"records": list of publications}, and {"options": options of the run}
+    Returns: tables (dictionary) - result tables
+    """
+    request = urllib.request.Request(url, data=json.dumps(job).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return pickle.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise RuntimeError("Worker failed: {}".format(e.read().decode("utf-8")))
@@ -0,0 +1,156 @@
+"""
+Writing result tables as excel, streaming excel, CSV or Parquet files.
+"""
+
+import os
+import time
+import pandas as pd
+
+# file extension of each output format
+extensions = {"xlsx": ".xlsx", "xlsx-stream": ".xlsx", "csv": ".csv", "parquet": ".parquet"}
+
+class TableWriter:
+    """
+    Write a table to one file, one chunk of rows at a time.
+
+    xlsx-stream, csv and parquet write each chunk as it comes, so memory does not grow with the table.
+    xlsx keeps the chunks and writes them with DataFrame.to_excel when closed.
+    parquet takes the column types from the first chunk with rows and writes text and empty columns as strings.
+    """
+
+    def __init__(self, path, output_format="xlsx"):
+        """
+        Input: path (string) - path to output file
+               output_format (string) - one of extensions
+        """
+        self.path = path
+        self.output_format = output_format
+        self.rows = 0
+        self.columns = None
+        self.chunks = []
+        self.file = None
+
+    def write(self, df):
+        """
+        Append rows to file.
+
+        Input: df (dataframe) - rows with the same columns as the first chunk
+        """
+        first = self.columns is None
+        if first:
+            self.columns = list(df.columns)
+        df = df[self.columns]
+        self.rows += df.shape[0]
+
+        if self.output_format == "xlsx":
+            self.chunks.append(df)
+
+        elif self.output_format == "csv":
+            if first:
+                self.file = open(self.path, "w", newline="", encoding="utf-8")
+            df.to_csv(self.file, header=first, index=False)
+
+        elif self.output_format == "parquet":
+            # types are taken from the first chunk with rows, empty chunks before it are kept for close
+            if self.file is None and df.shape[0] == 0:
+                self.chunks = [df]
+            else:
+                self.write_parquet(df)
+
+        elif self.output_format == "xlsx-stream":
+            if first:
+                from openpyxl import Workbook
+                self.file = Workbook(write_only=True)
+                self.sheet = self.file.create_sheet()
+                self.sheet.append(self.columns)
+            # empty values as blank cells
+            values = df.astype(object).where(pd.notnull(df), None)
+            for row in values.itertuples(index=False, name=None):
+                self.sheet.append(list(row))
+
+        else:
+            raise ValueError("Unsupported output format: {}".format(self.output_format))
+
+    def write_parquet(self, df):
+        """
+        Append rows to Parquet file, opening it with the types of the first chunk.
+
+        Input: df (dataframe) - rows with the same columns as the first chunk
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.file is None:
+            # text columns and columns without values in the first chunk (e.g. Link_to_trial without NCT IDs) are
+            # written as strings, so later chunks holding strings fit the schema
+            self.strings = [column for column in self.columns if df[column].dtype == object or df[column].isnull().all()]
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            for column in self.strings:
+                schema = schema.set(schema.get_field_index(column), pa.field(column, pa.string()))
+            self.file = pq.ParquetWriter(self.path, schema)
+
+        # keep types of first chunk
+        df = df.assign(**{column: df[column].astype(object).map(lambda x: None if pd.isnull(x) else str(x))
+                          for column in self.strings})
+        self.file.write_table(pa.Table.from_pandas(df, schema=self.file.schema, preserve_index=False))
+
+    def close(self):
+        """
+        Finish writing file.
+        """
+        if self.output_format == "xlsx":
+            if len(self.chunks) > 0:
+                pd.concat(self.chunks).to_excel(self.path, index=False)
+            self.chunks = []
+        elif self.output_format == "xlsx-stream":
+            if self.file is not None:
+                self.file.save(self.path)
+        elif self.output_format == "parquet" and self.file is None:
+            # only empty chunks, write the table without rows
+            if len(self.chunks) > 0:
+                self.write_parquet(self.chunks[0])
+                self.file.close()
+            self.chunks = []
+        elif self.file is not None:
+            self.file.close()
+
+def output_path(directory, name, date, output_format):
+    """
+    Make path of output file.
+
+    Input: directory (string) - result folder
+           name (string) - name of table, e.g. entities
+           date (string) - date added to file name
+           output_format (string) - one of extensions
+    Returns: path (string)
+    """
+    return os.path.join(directory, "{}_{}{}".format(name, date, extensions[output_format]))
+
+def write_table(df, directory, name, date, output_format="xlsx", chunksize=10000):
+    """
+    Write table and print how long it took.
+
+    Input: df (dataframe) - table to write
+           directory (string) - result folder
+           name (string) - name of table, e.g. entities
+           date (string) - date added to file name
+           output_format (string) - one of extensions
+           chunksize (int) - number of rows converted at a time by streaming writers
+    Returns: seconds (float) - time taken to write file
+    """
+    start = time.perf_counter()
+    path = output_path(directory, name, date, output_format)
+
+    if output_format == "xlsx":
+        # same as before output formats were added
+        df.to_excel(path, index=False)
+    else:
+        writer = TableWriter(path, output_format)
+        for i in range(0, max(df.shape[0], 1), chunksize):
+            writer.write(df.iloc[i:i + chunksize])
+        writer.close()
+
+    seconds = time.perf_counter() - start
+    print("Saved {} ({} rows) in {:.2f}s".format(os.path.basename(path), df.shape[0], seconds), flush = True)
+
+    return seconds
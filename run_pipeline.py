@@ -10,16 +10,57 @@ python run_pipeline.py -input <path/to/file> --output <path/to/folder> [options]
 
 Example:
 python run_pipeline.py -input isearch_test.xlsx --output results
+python run_pipeline.py -input "exports/*.xlsx" --output results
+
+To keep models loaded between runs, start a worker and submit jobs to it:
+python run_pipeline.py --serve --port 8765
+python run_pipeline.py -input isearch_test.xlsx --output results --worker http://127.0.0.1:8765
 
 Parameters:
 Required:
--input: path to publication file (iSearch excel file)
+-input: path to publication file (iSearch excel, CSV, Parquet or JSON lines file), or a folder or glob pattern of publication files, e.g. "exports/*.xlsx". Files of a folder or pattern are combined and publications with the same System ID, DOI or PMID as an earlier one are dropped before classification, so each is classified and run through NER once and the results are in one set of files
 Optional:
 --output: path to result folder
+--all-columns: load every column of the publication file (default: only System ID, Title, Abstract, DOI and PMID)
+--output-format: format of result files: xlsx, xlsx-stream (excel written row by row in constant memory), csv or parquet (default: xlsx)
+--n-jobs: number of processes used for text cleaning and classification (default: 1)
+--classify-chunk-size: number of publications encoded and classified at a time, in parallel with --n-jobs (default: all at once)
+--classifier-engine: "sklearn" for the pickled classifier or "numpy" for the classifier exported with pipeline_scripts/export_classifier.py, which does not import sklearn (default: sklearn)
+--classifier-mmap: memory-map the arrays of the numpy classifier
+--min-probability: only send relevant abstracts with at least this classifier probability to NER
+--top-k: only send this many relevant abstracts to NER, highest probability first
+--ner-budget: seconds available for NER, the number of abstracts sent to NER is capped at budget x --ner-docs-per-sec
+--ner-docs-per-sec: NER throughput, e.g. the docs/sec printed by a previous run
+--clean-processes: number of processes the animal, assay, correlate and vaccine categorizers run in at the same time, each with only the entities of its class (default: 1, at most 4 are used)
+--batch-size: number of abstracts per NER batch (runs NER with nlp.pipe)
+--n-process: number of processes used for NER (default: 1)
+--sort-by-length: run abstracts through NER from shortest to longest so batches hold abstracts of similar length (output order is unchanged), with nlp.pipe also without --batch-size
+--ner-profile: NER model profile, "full" or "entities" (tagger and parser disabled) (default: full)
+--check-ner-profile: check that --ner-profile extracts the same entities as the full model and report the speedup
+--sentences: add character offsets of the sentence of each entity (needs the full NER profile)
+--ner-cache: path to NER cache file, abstracts already in cache are not run through NER model
+--ner-cache-size: maximum number of abstracts kept in NER cache (default: 100000)
+--category-memo: path to file of categories of entity texts categorized in earlier runs, which are not categorized again. Categories of a class are cleared when its rule file or the vaccine info file changes
+--save-docs: path to file to save the docs processed by the NER model to, keyed by System_ID
+--reuse-docs: path to file of saved docs, abstracts with a saved doc of the same text are not run through the NER model (with --sentences, only docs saved with the full NER profile are reused)
+--incremental: only run publications that are new or changed since previous runs, or whose results are from another classifier, NER model or categorization rules, and merge them with previous results
+--state-dir: folder to keep run state and previous results in for --incremental (default: <output>/.pipeline_state)
+--stages: comma separated consecutive stages to run: classify, prep, ner and clean, e.g. classify,prep or ner,clean. Same as --from-stage and --to-stage, modules of stages not run are not imported
+--from-stage: first stage to run: load, classify, prep, ner or clean, tables of earlier stages are loaded from the checkpoints of an earlier run (default: load, -input not needed for later stages)
+--to-stage: last stage to run, result files of later stages are not written (default: clean)
+--checkpoint-dir: folder the table of each stage is saved to as a checkpoint (default: <output>/checkpoints)
+--profile: write cProfile data of each stage to <output>/profiles/<stage>.prof (view with python -m pstats)
+--stream: read the publication file in chunks and run each chunk through classification, preparation, NER and categorization, with the stages running at the same time on different chunks and result files written as chunks finish, so memory does not grow with the file size. Excel results are written with xlsx-stream. Categorized entities are grouped by chunk. Saved docs of --reuse-docs are loaded once. Not with --top-k, --ner-budget or --save-docs
+--chunksize: number of publications per chunk with --stream (default: 10000)
+--queue-size: maximum number of chunks waiting between two stages with --stream (default: 2)
+--results-db: path to SQLite results database to update with the publications, entities and categories of the run, created if missing. Results of a publication replace its results from earlier runs
+--serve: run as worker that loads the models once and runs jobs sent with --worker (-input not needed)
+--port: localhost port the worker listens on (default: 8765)
+--worker: address of running worker to run the pipeline, e.g. http://127.0.0.1:8765. Options of the run (e.g. --min-probability, --top-k, --batch-size, --sentences, --clean-processes) are sent with the job and result files are written with --output-format. --ner-profile must be the one the worker was started with. Not with --incremental, --profile or the model options --classifier-engine, --classifier-mmap, --ner-cache, --ner-cache-size and --category-memo, which are set when starting the worker
 Other:
 -h, --help: help message
 
-Files that are generated:
+Files that are generated (.csv or .parquet with --output-format csv or parquet):
 
 covid_relevant_abstracts_<date>.xlsx: excel file of COVID-19 publication data identified as relevant by classifier
 
@@ -28,137 +69,624 @@ covid_relevant_abstracts_processed_<date>.xlsx: excel file of relevant processed
 entities_<date>.xlsx: excel file with entities from customized NER model
 
 entities_with_categories_<date>.xlsx: excel file with entities and their categories
+
+run_metrics_<date>.json: wall time, CPU time, peak memory, rows in and out and docs/sec of each stage (load, classify, prep, ner, each categorizer and each file written)
 """
 import os
 import argparse
-import pandas as pd
-import pipeline_scripts.classifier as clf
-import pipeline_scripts.ner as ner
-import pipeline_scripts.prepare_isearch_data as prep
-import pipeline_scripts.clean_animal_entities as cln_animal
-import pipeline_scripts.clean_correlate_entities as cln_correlate
-import pipeline_scripts.clean_assay_entities as cln_assay
-import pipeline_scripts.clean_vaccine_entities as cln_vaccine
+import pipeline_scripts.lazy as lazy
+import pipeline_scripts.checkpoints as checkpoints
+import pipeline_scripts.metrics as metrics
+import pipeline_scripts.streaming as streaming
+import time
 import warnings
+from multiprocessing import Pool
 from datetime import datetime
 import sys
 
+# imported when a stage first uses them, so --help and partial runs start fast
+pd = lazy.module("pandas")
+clf = lazy.module("pipeline_scripts.classifier")
+ner = lazy.module("pipeline_scripts.ner")
+ner_cache = lazy.module("pipeline_scripts.ner_cache")
+readers = lazy.module("pipeline_scripts.readers")
+writers = lazy.module("pipeline_scripts.writers")
+prep = lazy.module("pipeline_scripts.prepare_isearch_data")
+cln_animal = lazy.module("pipeline_scripts.clean_animal_entities")
+cln_correlate = lazy.module("pipeline_scripts.clean_correlate_entities")
+cln_assay = lazy.module("pipeline_scripts.clean_assay_entities")
+cln_vaccine = lazy.module("pipeline_scripts.clean_vaccine_entities")
+worker = lazy.module("pipeline_scripts.worker")
+run_state = lazy.module("pipeline_scripts.run_state")
+results_db = lazy.module("pipeline_scripts.results_db")
+category_memo = lazy.module("pipeline_scripts.category_memo")
+
 warnings.filterwarnings("ignore")
 
 # to suppress SettingWithCopyWarning
 #pd.options.mode.chained_assignment = None  # default='warn'
 
-def main(args):
+# file of vaccine info
+vaccine_file = "data/COVID_19_Tracker_Vaccines_01262021.csv"
 
-    ############## Load data ##############
-
-    # get start time
-    start = datetime.now()
-    # get date to add to file names
-    date = datetime.now().date().strftime("%Y%m%d")
-
-    print("Loading data...", flush = True)
-
-    # get path to publicaton file
-    pub_file = args.input
-
-    if args.output:
-        # get path to result folder
-        directory = args.output
-        # if result folder doesn't exit, create folder
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-    else:
-        # use current directory
-        directory = os.getcwd()
+def load_data(pub_file, all_columns=False):
+    """
+    Read iSearch file (excel, CSV, Parquet or JSON lines), or all files of a folder or glob pattern
+    with duplicate publications dropped.
 
-    # read in excel file
+    Input: pub_file (string) - path to publication file, folder or glob pattern
+           all_columns (bool) - load every column, not only the ones used by the pipeline
+    Returns: df (dataframe)
+    """
+    # read in file
     with warnings.catch_warnings(record=True):
         warnings.simplefilter("always")
         try:
-            df = pd.read_excel(pub_file)
-            if "System ID" not in df.columns:
-                sys.exit("This is not an iSearch file. Exiting...")
+            if readers.is_batch(pub_file):
+                df = readers.read_batch(pub_file, all_columns)
+            else:
+                df = readers.read_publications(pub_file, all_columns)
+        except ValueError as e:
+            sys.exit(str(e))
         except Exception as e:
             print(e)
             sys.exit("Exiting...")
 
-    print("Number of publications is {}.".format(df.shape[0]), flush = True)
+    return df
+
+def open_cache(args):
+    """
+    Open NER cache if requested.
+
+    Input: args (argparse.Namespace)
+    Returns: cache (EntityCache) - None if no cache file given
+    """
+    if not args.ner_cache:
+        return None
+
+    return ner_cache.EntityCache(args.ner_cache, ner_cache.model_version(ner.ner_model_dir), args.ner_cache_size)
+
+def open_category_memo(args):
+    """
+    Open memo of entity categories if requested.
+
+    Input: args (argparse.Namespace)
+    Returns: memo (CategoryMemo) - None if no memo file given
+    """
+    if not args.category_memo:
+        return None
+
+    return category_memo.CategoryMemo(args.category_memo, category_memo.rule_versions(vaccine_file))
+
+def close_caches(models):
+    """
+    Report and close NER cache and category memo.
+
+    Input: models (dictionary) - cache and category_memo, None if not used
+    """
+    for name in ["cache", "category_memo"]:
+        if models.get(name) is not None:
+            models[name].report()
+            models[name].close()
+
+def load_models(args):
+    """
+    Load classifier, NER model and vaccine info so they can be reused across runs.
+
+    Input: args (argparse.Namespace)
+    Returns: models (dictionary)
+    """
+    models = {}
+    models["classifier"] = clf.load_model(args.classifier_engine, args.classifier_mmap)
+    models["nlp"] = ner.load_model(args.ner_profile)
+    # create dictionary of vaccine info file
+    models["vaccine_dict"] = cln_vaccine.make_vaccine_dict(vaccine_file)
+    models["cache"] = open_cache(args)
+    models["category_memo"] = open_category_memo(args)
+
+    return models
+
+def classify(df, args, models):
+    """
+    Run classifier.
+
+    Input: df (dataframe) - iSearch publication data
+           args (argparse.Namespace)
+           models (dictionary) - classifier is loaded into models if missing
+    Returns: relevant_df (dataframe) - relevant publications
+    """
+    # nothing to classify, e.g. no new publications in an incremental run
+    if df.shape[0] == 0:
+        print("No publications to classify.", flush = True)
+        return df.assign(Text=pd.Series(dtype=object), prediction=pd.Series(dtype=int), probability=pd.Series(dtype=float))
 
-    ############## Run classifier ##############
     print("Running classifier...")
 
     # prepare text
-    df = clf.prepare_text(df)
+    df = clf.prepare_text(df, n_jobs=args.n_jobs)
+
+    # load classifier
+    if models.get("classifier") is None:
+        models["classifier"] = clf.load_model(args.classifier_engine, args.classifier_mmap)
 
     # get relevant publications
-    relevant_df = clf.get_relevant_articles(df)
+    relevant_df = clf.get_relevant_articles(df, model=models["classifier"], chunk_size=args.classify_chunk_size, n_jobs=args.n_jobs)
 
     print("Number of relevant publications is {}.".format(relevant_df.shape[0]), flush = True)
 
-    # check if there are relevant abstracts, if not end pipeline
-    if relevant_df.shape[0] > 0:
-        print("Saving file...", flush = True)
-        # save as excel file (check if output folder and/or prefix)
-        relevant_df.to_excel(os.path.join(directory, "covid_relevant_abstracts_{}.xlsx".format(date)), index=False)
-    else:
+    # check if there are relevant abstracts
+    if relevant_df.shape[0] == 0:
         print("No relevant abstracts found.", flush = True)
-        print("Exiting...")
 
-    ############## Prepare data for dashboard ##############
+    return relevant_df
 
-    print("Preparing data for dashboard...", flush = True)
+def prepare(relevant_df, args):
+    """
+    Limit abstracts sent to NER and prepare data for dashboard.
 
-    # process data
-    processed_df = prep.process_data(relevant_df)
+    Input: relevant_df (dataframe) - relevant publications
+           args (argparse.Namespace)
+    Returns: processed_df (dataframe)
+    """
+    # limit abstracts sent to NER
+    gated_df = relevant_df
+    if args.min_probability is not None or args.top_k is not None or args.ner_budget is not None:
+        gated_df = clf.gate_relevant(relevant_df, min_probability=args.min_probability, top_k=args.top_k,
+                                     budget=args.ner_budget, docs_per_sec=args.ner_docs_per_sec)
 
-    print("Saving file...", flush = True)
-
-    # save to excel file
-    processed_df.to_excel(os.path.join(directory,"covid_relevant_abstracts_processed_{}.xlsx".format(date)), index = False, na_rep="")
+    print("Preparing data for dashboard...", flush = True)
 
-    ############## Run customized NER model ##############
+    # process data - on a copy, as column names are changed in place
+    return prep.process_data(gated_df.copy())
+
+def extract_entities(processed_df, args, models):
+    """
+    Run customized NER model.
+
+    Input: processed_df (dataframe) - processed relevant publications
+           args (argparse.Namespace)
+           models (dictionary) - NER model, cache and saved docs, model is loaded when needed if missing
+    Returns: entity_df (dataframe)
+    """
+    # no abstracts to run through NER, the model is not loaded
+    if processed_df.shape[0] == 0:
+        print("No abstracts to run through NER model.", flush = True)
+        columns = ["System_ID", "Entity", "Class", "Start", "End"]
+        if args.sentences:
+            columns += ["Sent_Start", "Sent_End"]
+        return pd.DataFrame([], columns=columns)
 
     print("Running NER model...", flush = True)
 
-    # get entities from each abstract
-    entity_df = ner.get_entities(processed_df)
+    if args.check_ner_profile:
+        # compare entities and timing of selected profile against full model
+        ner.check_profile(processed_df, profile=args.ner_profile, batch_size=args.batch_size, n_process=args.n_process)
 
-    print("Saving file...", flush = True)
+    # load saved docs to reuse their entities, unless already loaded into models
+    doc_store = models.get("doc_store")
+    if doc_store is None and args.reuse_docs:
+        doc_store = ner.load_docs(args.reuse_docs)
 
-    # save to excel file
-    entity_df.to_excel(os.path.join(directory,"entities_{}.xlsx".format(date)), index=False)
+    # get entities from each abstract
+    return ner.get_entities(processed_df, batch_size=args.batch_size, n_process=args.n_process, profile=args.ner_profile,
+                            nlp=models.get("nlp"), sentences=args.sentences, cache=models.get("cache"),
+                            doc_store=doc_store, docs_path=args.save_docs, sort_by_length=args.sort_by_length)
+
+def measure(metrics, stage, df, step):
+    """
+    Run a stage, measured if metrics are recorded.
+
+    Input: metrics (StageMetrics) - None to not measure
+           stage (string) - stage name
+           df (dataframe) - input of stage
+           step (function) - runs stage, returns a dataframe
+    Returns: output of step
+    """
+    if metrics is None:
+        return step()
+
+    with metrics.stage(stage, rows_in=df.shape[0]) as record:
+        result = step()
+        record["rows_out"] = result.shape[0]
+
+    return result
+
+# categorizer of each entity class, in the order categorized entities are combined
+categorizers = [("animal", "Animals"), ("assay", "Assays"), ("correlate", "Correlates"), ("vaccine", "Vaccines")]
+
+def clean_class(ent_class, entity_df, vaccine_dict=None, memo=None):
+    """
+    Categorize entities of one class.
+
+    Input: ent_class (string) - animal, assay, correlate or vaccine
+           entity_df (dataframe) - entities, only the ones of ent_class are categorized
+           vaccine_dict (dictionary) - vaccine info, needed for vaccine class
+           memo (dictionary) - categories of entity texts categorized before
+    Returns: categorized entities (dataframe), wall seconds (float), cpu seconds (float),
+             memo (dictionary) - categories of entity texts with the ones categorized now
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    if memo is None:
+        memo = {}
+
+    if ent_class == "animal":
+        result = cln_animal.clean_ents(entity_df, memo)
+    elif ent_class == "assay":
+        result = cln_assay.clean_ents(entity_df, memo)
+    elif ent_class == "correlate":
+        result = cln_correlate.clean_ents(entity_df, memo)
+    else:
+        result = cln_vaccine.clean_ents(entity_df, vaccine_dict, memo)
 
-    ############## Clean entities ##############
+    return result, time.perf_counter() - wall_start, time.process_time() - cpu_start, memo
 
-    print("Cleaning entities...", flush = True)
+def categorize(entity_df, args, models, metrics=None):
+    """
+    Categorize animal, assay, correlate and vaccine entities.
 
-    animal_df = cln_animal.clean_ents(entity_df)
-    print("Animals are categorized.", flush = True)
+    With args.clean_processes above 1 the categorizers run at the same time in separate processes,
+    each sent only the entities of its class. Entity texts in the category memo are not categorized again
+    and the categories of new texts are added to it.
 
-    assay_df = cln_assay.clean_ents(entity_df)
-    print("Assays are categorized.", flush = True)
+    Input: entity_df (dataframe) - entities from NER model
+           args (argparse.Namespace)
+           models (dictionary) - vaccine info, read if missing, and category memo, None if not used
+           metrics (StageMetrics) - records each categorizer, None to not measure
+    Returns: all_final_ents_df (dataframe) - categorized entities
+    """
+    # no entities to categorize
+    if entity_df.shape[0] == 0:
+        print("No entities to categorize.", flush = True)
+        return entity_df.assign(Category=pd.Series(dtype=object))
 
-    correlate_df = cln_correlate.clean_ents(entity_df)
-    print("Correlates are categorized.", flush = True)
+    print("Cleaning entities...", flush = True)
 
-    # file of vaccine info
-    vaccine_file = "data/COVID_19_Tracker_Vaccines_01262021.csv"
     # create dictionary of vaccine info file
-    vaccine_dict = cln_vaccine.make_vaccine_dict(vaccine_file)
-    vaccine_df = cln_vaccine.clean_ents(entity_df, vaccine_dict)
-    print("Vaccines are categorized.", flush = True)
+    if models.get("vaccine_dict") is None:
+        models["vaccine_dict"] = cln_vaccine.make_vaccine_dict(vaccine_file)
+
+    # entities of each class
+    partitions = {ent_class: entity_df[entity_df.Class == ent_class] for ent_class, _ in categorizers}
+
+    # categories of entity texts categorized in earlier runs
+    memo = models.get("category_memo")
+    known = {ent_class: {} for ent_class, _ in categorizers}
+    if memo is not None:
+        for ent_class, _ in categorizers:
+            known[ent_class] = memo.get_many(ent_class, partitions[ent_class].Entity.unique().tolist())
+
+    if args.clean_processes > 1:
+        with Pool(min(args.clean_processes, len(categorizers))) as pool:
+            # start slowest categorizer first
+            pending = {ent_class: pool.apply_async(clean_class, (ent_class, partitions[ent_class], models["vaccine_dict"],
+                                                                 dict(known[ent_class])))
+                       for ent_class, _ in reversed(categorizers)}
+            results = {}
+            for ent_class, name in categorizers:
+                results[ent_class] = pending[ent_class].get()
+                print("{} are categorized.".format(name), flush = True)
+    else:
+        results = {}
+        for ent_class, name in categorizers:
+            results[ent_class] = clean_class(ent_class, partitions[ent_class], models["vaccine_dict"], dict(known[ent_class]))
+            print("{} are categorized.".format(name), flush = True)
+
+    if memo is not None:
+        # save categories of new entity texts
+        for ent_class, _ in categorizers:
+            memo.put_many(ent_class, {entity: categories for entity, categories in results[ent_class][3].items()
+                                      if entity not in known[ent_class]})
+
+    if metrics is not None:
+        for ent_class, _ in categorizers:
+            result, wall_seconds, cpu_seconds, _ = results[ent_class]
+            metrics.add("clean_" + ent_class, wall_seconds, cpu_seconds, partitions[ent_class].shape[0], result.shape[0])
 
     # combine all categorized entities
-    all_final_ents_df = pd.concat([animal_df, assay_df, correlate_df, vaccine_df])
+    return pd.concat([results[ent_class][0] for ent_class, _ in categorizers])
+
+def run(df, args, models=None, checkpoint_dir=None, metrics=None):
+    """
+    Run classifier, prepare data for dashboard, run NER model and categorize entities.
+
+    Input: df (dataframe) - iSearch publication data, None when resuming after classification
+           args (argparse.Namespace) - stages from args.from_stage to args.to_stage are run
+           models (dictionary) - models from load_models, models missing are loaded when needed
+           checkpoint_dir (string) - folder to save the table of each stage to, and to load tables of earlier stages from
+           metrics (StageMetrics) - records each stage, None to not measure
+    Returns: tables (dictionary) - relevant, processed, entities and categories dataframes, up to the last stage run
+    """
+    if models is None:
+        models = {}
+
+    # stages after load, the table each one works on and how it is run
+    steps = [("classify", "publications", lambda df: classify(df, args, models)),
+             ("prep", "relevant", lambda df: prepare(df, args)),
+             ("ner", "processed", lambda df: extract_entities(df, args, models)),
+             ("clean", "entities", lambda df: categorize(df, args, models, metrics))]
+
+    first = checkpoints.stages.index(args.from_stage)
+    last = checkpoints.stages.index(args.to_stage)
+
+    tables = {"publications": df}
+    for index, (stage, input_name, step) in enumerate(steps, 1):
+        name = checkpoints.stage_tables[stage]
+        if index > last:
+            break
+        if index < first:
+            # resume with table of earlier run
+            print("Loading checkpoint of stage {}...".format(stage), flush = True)
+            tables[name] = checkpoints.load_checkpoint(checkpoint_dir, stage)
+            continue
+
+        tables[name] = measure(metrics, stage, tables[input_name], lambda: step(tables[input_name]))
+        if checkpoint_dir is not None:
+            checkpoints.save_checkpoint(checkpoint_dir, stage, tables[name])
+
+    del tables["publications"]
+
+    return tables
+
+def run_incremental(df, args, models, state, metrics=None):
+    """
+    Run only the publications that are new or changed, or whose results are from other model or rule versions,
+    and merge them with the results of previous runs.
+
+    Input: df (dataframe) - iSearch publication data
+           args (argparse.Namespace)
+           models (dictionary) - models missing are loaded when needed
+           state (RunState) - run state of previous runs
+           metrics (StageMetrics) - records each stage, None to not measure
+    Returns: tables (dictionary) - relevant, processed, entities and categories dataframes of all runs
+    """
+    versions = run_state.stage_versions(ner.ner_model_dir, args.ner_profile, args.sentences)
+
+    # find publications to rerun
+    ids = df["System ID"].astype(str)
+    hashes = run_state.text_hashes(df)
+    classify_ids, ner_ids, categorize_ids = state.plan(ids, hashes, versions)
+
+    print("Publications to classify: {}, to run through NER: {}, to categorize: {}.".format(
+          len(classify_ids), len(ner_ids), len(categorize_ids)), flush = True)
+
+    prev = state.load_tables()
+
+    # classify new and changed publications
+    selected = ids.isin(classify_ids)
+    classify_df = df[selected]
+    relevant_df = measure(metrics, "classify", classify_df, lambda: classify(classify_df, args, models))
+
+    # NER on newly relevant publications and on publications run through another NER version
+    ner_df = run_state.merge(relevant_df, run_state.keep_ids(prev["relevant"], "relevant", ner_ids))
+    processed_df = measure(metrics, "prep", ner_df, lambda: prepare(ner_df, args))
+    entity_df = measure(metrics, "ner", processed_df, lambda: extract_entities(processed_df, args, models))
+
+    # categorize new entities and entities categorized with other rules
+    categorize_df = run_state.merge(entity_df, run_state.keep_ids(prev["entities"], "entities", categorize_ids))
+    all_final_ents_df = measure(metrics, "clean", categorize_df, lambda: categorize(categorize_df, args, models, metrics))
+
+    # replace results of rerun publications
+    ner_run = classify_ids | ner_ids
+    tables = {"relevant": run_state.merge(run_state.drop_ids(prev["relevant"], "relevant", classify_ids), relevant_df),
+              "processed": run_state.merge(run_state.drop_ids(prev["processed"], "processed", ner_run), processed_df),
+              "entities": run_state.merge(run_state.drop_ids(prev["entities"], "entities", ner_run), entity_df),
+              "categories": run_state.merge(run_state.drop_ids(prev["categories"], "categories", ner_run | categorize_ids), all_final_ents_df)}
+
+    # save results before recording them, so results that failed to save are run again
+    state.save_tables(tables)
+
+    # record what was run - relevant publications held back by --min-probability, --top-k or --ner-budget
+    # did not reach NER and are run through NER in later runs
+    relevant_ids = set(relevant_df["System ID"].astype(str))
+    processed_ids = set(processed_df["System_ID"].astype(str))
+    state.record_classified(ids[selected], hashes[selected], relevant_ids, versions["classifier"])
+    state.record_stage("ner_version", processed_ids, versions["ner"])
+    state.record_stage("rules_version", processed_ids | categorize_ids, versions["rules"])
+
+    return tables
+
+def run_stream(args, models, directory, date, metrics=None):
+    """
+    Run the pipeline on chunks of the publication file. Each stage runs in its own thread on one chunk at a time
+    and result files are written as chunks come out of each stage, so memory does not grow with the file.
+    Categorized entities are combined per chunk, so rows are grouped by chunk.
+
+    Input: args (argparse.Namespace) - args.chunksize publications are read at a time
+           models (dictionary) - models missing are loaded before the first chunk
+           directory (string) - result folder
+           date (string) - date added to file names
+           metrics (StageMetrics) - records each stage over all chunks, None to not measure
+    """
+    # excel files can only be streamed in write-only mode
+    output_format = args.output_format
+    if output_format == "xlsx":
+        output_format = "xlsx-stream"
+
+    # load models once instead of for each chunk
+    if models.get("classifier") is None:
+        models["classifier"] = clf.load_model(args.classifier_engine, args.classifier_mmap)
+    if models.get("nlp") is None:
+        models["nlp"] = ner.load_model(args.ner_profile)
+    if models.get("vaccine_dict") is None:
+        models["vaccine_dict"] = cln_vaccine.make_vaccine_dict(vaccine_file)
+    # saved docs are read once instead of for each chunk
+    if args.reuse_docs and models.get("doc_store") is None:
+        models["doc_store"] = ner.load_docs(args.reuse_docs)
+
+    table_writers = {name: writers.TableWriter(writers.output_path(directory, file_name, date, output_format), output_format)
+                     for name, file_name in result_files}
+
+    pipeline = streaming.Pipeline([("classify", lambda df: classify(df, args, models), table_writers["relevant"]),
+                                   ("prep", lambda df: prepare(df, args), table_writers["processed"]),
+                                   ("ner", lambda df: extract_entities(df, args, models), table_writers["entities"]),
+                                   ("clean", lambda df: categorize(df, args, models), table_writers["categories"])],
+                                  queue_size=args.queue_size)
+
+    # read chunks of file, or of all files of a folder or glob pattern with duplicates dropped
+    if readers.is_batch(args.input):
+        chunks = readers.iter_batch(args.input, args.chunksize, args.all_columns)
+    else:
+        chunks = readers.iter_publications(args.input, args.chunksize, args.all_columns)
 
-    print("Saving file...", flush = True)
+    try:
+        chunk_count = pipeline.run(chunks)
+    finally:
+        for writer in table_writers.values():
+            writer.close()
 
-    # save to excel file
-    all_final_ents_df.to_excel(os.path.join(directory,"entities_with_categories_{}.xlsx".format(date)), index=False)
+    # like save_tables, no file of relevant abstracts if there are none
+    if table_writers["relevant"].rows == 0 and os.path.exists(table_writers["relevant"].path):
+        os.remove(table_writers["relevant"].path)
 
+    print("Ran {} chunks of up to {} publications.".format(chunk_count, args.chunksize), flush = True)
+    for name, file_name in result_files:
+        print("Saved {} ({} rows)".format(os.path.basename(table_writers[name].path), table_writers[name].rows), flush = True)
     print("All files saved in: {}".format(os.path.abspath(directory)), flush = True)
 
+    if metrics is not None:
+        for stage, totals in pipeline.totals.items():
+            metrics.add(stage, totals["wall_seconds"], totals["cpu_seconds"], totals["rows_in"], totals["rows_out"])
+
+# result table and file name of each result file
+result_files = [("relevant", "covid_relevant_abstracts"), ("processed", "covid_relevant_abstracts_processed"),
+                ("entities", "entities"), ("categories", "entities_with_categories")]
+
+def save_tables(tables, directory, date, output_format="xlsx", metrics=None):
+    """
+    Save result tables.
+
+    Input: tables (dictionary) - result tables from run, tables of stages not run are skipped
+           directory (string) - result folder
+           date (string) - date added to file names
+           output_format (string) - xlsx, xlsx-stream, csv or parquet
+           metrics (StageMetrics) - records each write, None to not measure
+    Returns: times (dictionary) - seconds taken to write each file
+    """
+    print("Saving files...", flush = True)
+
+    times = {}
+
+    for name, file_name in result_files:
+        # skip tables of stages not run, and relevant abstracts if there are none
+        if name not in tables or (name == "relevant" and tables[name].shape[0] == 0):
+            continue
+
+        if metrics is None:
+            times[file_name] = writers.write_table(tables[name], directory, file_name, date, output_format)
+        else:
+            with metrics.stage("write_" + file_name, rows_in=tables[name].shape[0]) as record:
+                times[file_name] = writers.write_table(tables[name], directory, file_name, date, output_format)
+                record["rows_out"] = tables[name].shape[0]
+
+    print("All files saved in: {}".format(os.path.abspath(directory)), flush = True)
+
+    return times
+
+def main(args):
+
+    if args.serve:
+        # load models once and wait for jobs
+        worker.serve(args.port, load_data, run, load_models(args), args)
+        return
+
+    ############## Load data ##############
+
+    # get start time
+    start = datetime.now()
+    # get date to add to file names
+    date = datetime.now().date().strftime("%Y%m%d")
+
+    if args.output:
+        # get path to result folder
+        directory = args.output
+        # if result folder doesn't exit, create folder
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+    else:
+        # use current directory
+        directory = os.getcwd()
+
+    # time, memory and throughput of each stage, cProfile data of each stage with --profile
+    stage_metrics = metrics.StageMetrics(os.path.join(directory, "profiles") if args.profile else None)
+
+    if args.worker:
+        # send publication file and options of this run to running worker
+        print("Submitting job to worker at {}...".format(args.worker), flush = True)
+        options = {name: getattr(args, name) for name in worker.job_options}
+        # paths are opened by the worker
+        for name in ["save_docs", "reuse_docs"]:
+            if options[name]:
+                options[name] = os.path.abspath(options[name])
+        try:
+            tables = worker.submit(args.worker, {"input": os.path.abspath(args.input), "options": options})
+        except Exception as e:
+            print(e)
+            sys.exit("Exiting...")
+    elif args.stream:
+        # run chunks of publications through overlapping stages, result files are written as they go
+        models = {"cache": open_cache(args), "category_memo": open_category_memo(args)}
+        try:
+            run_stream(args, models, directory, date, stage_metrics)
+        except ValueError as e:
+            sys.exit(str(e))
+
+        close_caches(models)
+    else:
+        # folder of stage checkpoints
+        checkpoint_dir = args.checkpoint_dir or os.path.join(directory, "checkpoints")
+
+        df = None
+        if args.from_stage == "load":
+            print("Loading data...", flush = True)
+
+            # get path to publicaton file
+            with stage_metrics.stage("load") as record:
+                df = load_data(args.input, args.all_columns)
+                record["rows_out"] = df.shape[0]
+            checkpoints.save_checkpoint(checkpoint_dir, "load", df)
+
+            print("Number of publications is {}.".format(df.shape[0]), flush = True)
+        elif args.from_stage == "classify":
+            print("Loading checkpoint of stage load...", flush = True)
+            try:
+                df = checkpoints.load_checkpoint(checkpoint_dir, "load")
+            except ValueError as e:
+                sys.exit(str(e))
+
+        # open cache of NER results and memo of entity categories
+        models = {"cache": open_cache(args), "category_memo": open_category_memo(args)}
+
+        if args.incremental:
+            # rerun only what changed since previous runs
+            state = run_state.RunState(args.state_dir or os.path.join(directory, ".pipeline_state"))
+            tables = run_incremental(df, args, models, state, stage_metrics)
+            state.close()
+        else:
+            try:
+                tables = run(df, args, models, checkpoint_dir, stage_metrics)
+            except ValueError as e:
+                sys.exit(str(e))
+
+        close_caches(models)
+
+    if not args.stream:
+        save_tables(tables, directory, date, args.output_format, stage_metrics)
+
+        if args.results_db:
+            # update results database for dashboard queries
+            with stage_metrics.stage("write_results_db") as record:
+                db = results_db.ResultsDB(args.results_db)
+                db.write(tables)
+                db.close()
+            print("Results database updated: {}".format(os.path.abspath(args.results_db)), flush = True)
+
+    # report metrics of each stage and time taken to import modules used
+    stage_metrics.report()
+    lazy.report()
+    stage_metrics.save(os.path.join(directory, "run_metrics_{}.json".format(date)), lazy.import_times)
+
     # get time it took to run program
     print("Finished in {}".format(datetime.now()-start))
 
@@ -167,12 +695,100 @@ if __name__ == "__main__":
     # create arguments
     p = argparse.ArgumentParser(description=__doc__, prog = "run_pipeline.py",
         usage = "%(prog)s -input <path/to/file> -output <path/to/folder> -vaccine <path/to/file> --prefix <string> [options]", add_help=True)
-    p.add_argument("-input", help="publication file", required=True)
+    p.add_argument("-input", help="publication file, or folder or glob pattern of publication files")
     p.add_argument("--output", help="result folder")
+    p.add_argument("--all-columns", action="store_true", help="load every column of publication file")
+    p.add_argument("--output-format", choices=["xlsx", "xlsx-stream", "csv", "parquet"], default="xlsx", help="format of result files")
+    p.add_argument("--n-jobs", type=int, default=1, help="number of processes used for text cleaning and classification")
+    p.add_argument("--classify-chunk-size", type=int, help="number of publications classified at a time")
+    p.add_argument("--classifier-engine", choices=["sklearn", "numpy"], default="sklearn", help="classifier implementation")
+    p.add_argument("--classifier-mmap", action="store_true", help="memory-map arrays of numpy classifier")
+    p.add_argument("--min-probability", type=float, help="minimum classifier probability of abstracts sent to NER")
+    p.add_argument("--top-k", type=int, help="maximum number of abstracts sent to NER, highest probability first")
+    p.add_argument("--ner-budget", type=float, help="seconds available for NER")
+    p.add_argument("--ner-docs-per-sec", type=float, help="NER throughput used with --ner-budget")
+    p.add_argument("--clean-processes", type=int, default=1, help="number of processes the entity categorizers run in")
+    p.add_argument("--batch-size", type=int, help="number of abstracts per NER batch")
+    p.add_argument("--n-process", type=int, default=1, help="number of processes used for NER")
+    p.add_argument("--ner-profile", choices=["full", "entities"], default="full", help="NER model profile")
+    p.add_argument("--sort-by-length", action="store_true", help="batch abstracts of similar length together for NER")
+    p.add_argument("--check-ner-profile", action="store_true", help="check entities of --ner-profile against full model")
+    p.add_argument("--sentences", action="store_true", help="add sentence offsets of each entity")
+    p.add_argument("--ner-cache", help="NER cache file")
+    p.add_argument("--ner-cache-size", type=int, default=100000, help="maximum number of abstracts in NER cache")
+    p.add_argument("--category-memo", help="file of entity categories from earlier runs")
+    p.add_argument("--save-docs", help="file to save processed docs to")
+    p.add_argument("--reuse-docs", help="file of saved docs to take entities from")
+    p.add_argument("--incremental", action="store_true", help="only run new or changed publications and merge with previous results")
+    p.add_argument("--state-dir", help="folder of run state used with --incremental")
+    p.add_argument("--stages", help="comma separated stages to run, e.g. classify,prep or ner,clean")
+    p.add_argument("--from-stage", choices=checkpoints.stages, default="load", help="first stage to run, earlier stages are loaded from checkpoints")
+    p.add_argument("--to-stage", choices=checkpoints.stages, default="clean", help="last stage to run")
+    p.add_argument("--checkpoint-dir", help="folder of stage checkpoints")
+    p.add_argument("--profile", action="store_true", help="write cProfile data of each stage")
+    p.add_argument("--stream", action="store_true", help="run chunks of publications through overlapping stages")
+    p.add_argument("--chunksize", type=int, default=10000, help="number of publications per chunk with --stream")
+    p.add_argument("--queue-size", type=int, default=2, help="maximum number of chunks waiting between two stages with --stream")
+    p.add_argument("--results-db", help="SQLite results database to update")
+    p.add_argument("--serve", action="store_true", help="run as worker that keeps models loaded")
+    p.add_argument("--port", type=int, default=8765, help="localhost port of worker")
+    p.add_argument("--worker", help="address of running worker to submit job to")
     #p.add_argument("-vaccine", help="path to vaccine info file", required=True)
 
     # parse arguments
     args = p.parse_args()
 
+    if args.stages:
+        if args.from_stage != "load" or args.to_stage != "clean":
+            p.error("--stages can not be used with --from-stage or --to-stage")
+        # stages after load, loading is run with classify
+        names = checkpoints.stages[1:]
+        selected = [stage.strip() for stage in args.stages.split(",")]
+        unknown = [stage for stage in selected if stage not in names]
+        if unknown:
+            p.error("unknown stages: {}, use {}".format(", ".join(unknown), ",".join(names)))
+        positions = sorted(names.index(stage) for stage in selected)
+        if positions != list(range(positions[0], positions[-1] + 1)):
+            p.error("--stages must be consecutive stages, e.g. classify,prep or ner,clean")
+        args.from_stage = "load" if positions[0] == 0 else names[positions[0]]
+        args.to_stage = names[positions[-1]]
+
+    if args.input is None and not args.serve and args.from_stage == "load":
+        p.error("the following arguments are required: -input")
+
+    if checkpoints.stages.index(args.from_stage) > checkpoints.stages.index(args.to_stage):
+        p.error("--from-stage comes after --to-stage")
+
+    if (args.from_stage != "load" or args.to_stage != "clean") and (args.incremental or args.serve or args.worker):
+        p.error("--from-stage and --to-stage can not be used with --incremental, --serve or --worker")
+
+    if args.worker and (args.incremental or args.profile):
+        p.error("--incremental and --profile can not be used with --worker")
+
+    if args.worker:
+        # models of the worker are loaded when it starts
+        changed = [name for name in worker.model_options if getattr(args, name) != p.get_default(name)]
+        if changed:
+            p.error("{} can not be used with --worker, models are loaded with the options the worker was started with".format(
+                    ", ".join("--" + name.replace("_", "-") for name in changed)))
+
+    if args.ner_budget is not None and args.ner_docs_per_sec is None:
+        p.error("--ner-budget needs --ner-docs-per-sec")
+
+    if args.stream and (args.incremental or args.serve or args.worker or args.from_stage != "load" or args.to_stage != "clean"):
+        p.error("--stream can not be used with --incremental, --serve, --worker, --from-stage or --to-stage")
+
+    if args.stream and (args.top_k is not None or args.ner_budget is not None or args.check_ner_profile):
+        p.error("--top-k, --ner-budget and --check-ner-profile need all publications at once and can not be used with --stream")
+
+    if args.stream and args.results_db:
+        p.error("--results-db can not be used with --stream")
+
+    if args.stream and args.save_docs:
+        p.error("--save-docs rewrites the whole doc store for each chunk and can not be used with --stream")
+
+    if args.sentences and args.ner_profile != "full":
+        p.error("--sentences needs the parser, use --ner-profile full")
+
     # run program with arguments
     main(args)